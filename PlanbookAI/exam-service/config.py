@@ -12,6 +12,8 @@ class Settings(BaseSettings):
     
     # Question Service URL
     QUESTION_SERVICE_URL: str = "http://question-service:8003"
+    # Questions of one exam fetched from it in parallel
+    QUESTION_FETCH_CONCURRENCY: int = 8
     
     class Config:
         env_file = ".env"
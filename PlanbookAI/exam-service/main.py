@@ -1,11 +1,14 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi import FastAPI, Depends, HTTPException, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 import uvicorn
 import requests
 import random
+import json
 import logging
 
 from models import Exam, ExamQuestion, ExamCreate, ExamUpdate, ExamResponse, ExamWithQuestions
@@ -28,24 +31,53 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Keep-alive connections to question-service, reused across requests
+question_session = requests.Session()
+question_session.mount("http://", HTTPAdapter(pool_maxsize=settings.QUESTION_FETCH_CONCURRENCY))
+question_fetcher = ThreadPoolExecutor(max_workers=settings.QUESTION_FETCH_CONCURRENCY)
+
+@app.on_event("shutdown")
+def close_question_session():
+    question_fetcher.shutdown(wait=False)
+    question_session.close()
+
+def fetch_question(qid, headers: dict) -> Optional[dict]:
+    response = question_session.get(
+        f"{settings.QUESTION_SERVICE_URL}/questions/{qid}",
+        headers=headers,
+        timeout=5
+    )
+    return response.json() if response.status_code == 200 else None
+
 def get_questions_from_service(question_ids: List[str], token: str):
-    """Fetch questions from Question Service"""
+    """Fetch questions from Question Service, several at a time, in the given order"""
     try:
         headers = {"Authorization": f"Bearer {token}"}
-        questions = []
-        for qid in question_ids:
-            response = requests.get(
-                f"{settings.QUESTION_SERVICE_URL}/questions/{qid}",
-                headers=headers,
-                timeout=5
-            )
-            if response.status_code == 200:
-                questions.append(response.json())
-        return questions
+        questions = question_fetcher.map(lambda qid: fetch_question(qid, headers), question_ids)
+        return [question for question in questions if question is not None]
     except Exception as e:
         logger.error(f"Error fetching questions: {e}")
         return []
 
+def answer_key_entry(question: dict, points) -> dict:
+    """Grading view of a question, accepting either question-service field naming"""
+    options = question.get("options") or {}
+    if isinstance(options, str):
+        options = json.loads(options)
+    if isinstance(options, list):
+        options = {
+            option.get("id"): option.get("text")
+            for option in options if isinstance(option, dict)
+        }
+    
+    return {
+        "id": str(question.get("id")),
+        "question_text": question.get("question_text") or question.get("content"),
+        "options": options,
+        "correct_answer": question.get("correct_answer") or question.get("correctOption"),
+        "points": float(points) if points is not None else 1.0
+    }
+
 @app.post("/exams", response_model=ExamResponse)
 async def create_exam(
     exam_data: ExamCreate,
@@ -119,6 +151,12 @@ async def add_questions_to_exam(
     
     db.commit()
     
+    # The answer key changed; consumers cache it per exam
+    publish_event("exam.updated", {
+        "exam_id": exam_id,
+        "updated_by": current_user['id']
+    })
+    
     logger.info(f"Added {len(question_ids)} questions to exam {exam_id}")
     return {"message": f"Added {len(question_ids)} questions successfully"}
 
@@ -189,6 +227,49 @@ async def get_exam(
         "question_count": len(questions)
     }
 
+@app.get("/exams/{exam_id}/answer-key")
+def get_exam_answer_key(
+    exam_id: str,
+    authorization: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Correct answers and points of all questions, in exam order (used for grading).
+    
+    A plain def so FastAPI runs the question-service calls in its threadpool.
+    """
+    exam = db.query(Exam).filter(Exam.id == exam_id).first()
+    
+    if not exam:
+        raise HTTPException(status_code=404, detail="Exam not found")
+    
+    if str(exam.created_by) != current_user['id']:
+        if current_user['role'] not in ['admin', 'manager', 'service']:
+            raise HTTPException(status_code=403, detail="Access denied")
+    
+    exam_questions = db.query(ExamQuestion).filter(
+        ExamQuestion.exam_id == exam_id
+    ).order_by(ExamQuestion.question_order).all()
+    
+    token = authorization.split()[-1]
+    questions = get_questions_from_service([eq.question_id for eq in exam_questions], token)
+    by_id = {str(question.get("id")): question for question in questions}
+    
+    # A partial key would shift question numbers, so refuse rather than guess
+    missing = [str(eq.question_id) for eq in exam_questions if str(eq.question_id) not in by_id]
+    if missing:
+        logger.error(f"Answer key for exam {exam_id} is missing questions: {missing}")
+        raise HTTPException(status_code=502, detail="Could not load all exam questions")
+    
+    return {
+        "exam_id": exam_id,
+        "status": exam.status,
+        "questions": [
+            answer_key_entry(by_id[str(eq.question_id)], eq.points)
+            for eq in exam_questions
+        ]
+    }
+
 @app.put("/exams/{exam_id}", response_model=ExamResponse)
 async def update_exam(
     exam_id: str,
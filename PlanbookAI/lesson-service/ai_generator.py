@@ -1,11 +1,21 @@
 import google.generativeai as genai
+from planbook_shared.gemini import GeminiCaller
 from config import settings
+from typing import List
 import json
 
-
+from metrics import registry
 
 genai.configure(api_key=settings.GEMINI_API_KEY)
 
+model = genai.GenerativeModel('gemini-pro')
+
+caller = GeminiCaller(model, settings, registry)
+
+async def generate_content(prompt: str) -> str:
+    """Call Gemini without blocking the event loop, with deadline and retries"""
+    return await caller.generate(prompt)
+
 async def generate_lesson_plan_with_ai(
     subject: str,
     topic: str,
@@ -41,9 +51,8 @@ async def generate_lesson_plan_with_ai(
     }}
     """
     
-    model = genai.GenerativeModel('gemini-pro')
-    response = model.generate_content(prompt)
+    response_text = await generate_content(prompt)
     
     # Parse JSON from response
-    result = json.loads(response.text)
+    result = json.loads(response_text)
     return result
\ No newline at end of file
@@ -12,6 +12,11 @@ class Settings(BaseSettings):
     
     # Gemini AI
     GEMINI_API_KEY: str = "your-gemini-api-key"
+    AI_MAX_IN_FLIGHT: int = 4
+    AI_TIMEOUT_SECONDS: float = 60.0
+    AI_MAX_RETRIES: int = 3
+    AI_BACKOFF_BASE_SECONDS: float = 1.0
+    AI_BACKOFF_MAX_SECONDS: float = 30.0
     
     class Config:
         env_file = ".env"
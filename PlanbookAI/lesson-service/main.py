@@ -1,5 +1,6 @@
 from fastapi import FastAPI, Depends, HTTPException, Query, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
@@ -15,6 +16,7 @@ from database import get_db, engine, Base
 from config import settings
 from utils import get_current_user, publish_event, require_roles
 from ai_generator import generate_lesson_plan_with_ai
+from metrics import registry as metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -31,6 +33,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Gemini call metrics are pushed to Redis from a background thread
+metrics.start_flusher()
+
 # ==================== LESSON PLANS ====================
 
 @app.post("/lessons", response_model=LessonPlanResponse)
@@ -409,6 +414,11 @@ async def get_lesson_stats(
         "by_subject": dict(by_subject)
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus metrics, including Gemini call latency and outcomes"""
+    return metrics.render()
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "lesson-service"}
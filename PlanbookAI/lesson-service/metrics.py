@@ -0,0 +1,6 @@
+"""Metrics of the lesson service, flushed to Redis under ``lesson:metrics``."""
+from planbook_shared.metrics import Metrics
+
+from utils import get_redis
+
+registry = Metrics("lesson", get_redis)
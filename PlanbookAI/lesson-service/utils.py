@@ -4,10 +4,15 @@ import jwt
 import pika
 import json
 import logging
+import redis
 from datetime import datetime
 
+from config import settings
+
 logger = logging.getLogger(__name__)
 
+_redis_client: Optional[redis.Redis] = None
+
 JWT_SECRET = "your-super-secret-jwt-key-change-in-production"
 JWT_ALGORITHM = "HS256"
 
@@ -37,6 +42,17 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
     except ValueError:
         raise HTTPException(status_code=401, detail="Invalid authorization header format")
 
+def get_redis() -> redis.Redis:
+    """Shared Redis client for this process"""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=1,
+            socket_connect_timeout=1
+        )
+    return _redis_client
+
 def publish_event(event_type: str, data: dict, queue_name: str = 'lesson_events'):
     try:
         credentials = pika.PlainCredentials('admin', 'admin123')
@@ -0,0 +1,95 @@
+"""Admission control for new OCR jobs.
+
+Uploads are refused with 429 once the queue or the user's own in-flight jobs
+reach their limits, instead of letting every job wait longer. Retry-After is
+estimated from the current drain rate (jobs finished over the last
+``OCR_DRAIN_WINDOW_SECONDS``). Queue depth, drain rate and estimated wait are
+exported as gauges.
+"""
+from fastapi import HTTPException
+from sqlalchemy import or_, func
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import math
+import time
+
+from models import OCRQueue
+from config import settings
+from metrics import set_gauge, increment
+
+ACTIVE_STATUSES = ("pending", "processing")
+
+_stats: Optional[Dict[str, float]] = None
+_stats_at = 0.0
+
+def queue_stats(db: Session, refresh: bool = False) -> Dict[str, float]:
+    """Queue depth, drain rate (jobs/s) and estimated wait, cached briefly per process"""
+    global _stats, _stats_at
+    if not refresh and _stats is not None and time.monotonic() - _stats_at < settings.OCR_QUEUE_STATS_TTL_SECONDS:
+        return _stats
+
+    since = datetime.utcnow() - timedelta(seconds=settings.OCR_DRAIN_WINDOW_SECONDS)
+    is_active = OCRQueue.status.in_(ACTIVE_STATUSES)
+    is_drained = OCRQueue.processing_completed_at >= since
+
+    depth, drained = db.query(
+        func.count(OCRQueue.id).filter(is_active),
+        func.count(OCRQueue.id).filter(is_drained)
+    ).filter(or_(is_active, is_drained)).one()
+
+    drain_rate = drained / settings.OCR_DRAIN_WINDOW_SECONDS
+    if drain_rate:
+        estimated_wait = depth / drain_rate
+    else:
+        # Nothing finished within the window: unknown unless the queue is empty
+        estimated_wait = 0.0 if depth == 0 else None
+
+    _stats = {
+        "queue_depth": depth,
+        "drain_rate": drain_rate,
+        "estimated_wait_seconds": estimated_wait
+    }
+    _stats_at = time.monotonic()
+
+    set_gauge("ocr_queue_depth", depth)
+    set_gauge("ocr_drain_rate_per_second", round(drain_rate, 4))
+    set_gauge("ocr_estimated_wait_seconds", -1 if estimated_wait is None else round(estimated_wait, 1))
+    return _stats
+
+def retry_after(jobs_to_drain: int, drain_rate: float) -> int:
+    """Seconds until enough jobs finish, clamped to the configured range"""
+    if drain_rate <= 0:
+        return settings.OCR_RETRY_AFTER_MAX_SECONDS
+    seconds = math.ceil(jobs_to_drain / drain_rate)
+    return max(settings.OCR_RETRY_AFTER_MIN_SECONDS, min(seconds, settings.OCR_RETRY_AFTER_MAX_SECONDS))
+
+def check_admission(db: Session, user_id: str, job_count: int = 1):
+    """Raise 429 with Retry-After if job_count more jobs would exceed a limit"""
+    if job_count > settings.OCR_MAX_USER_IN_FLIGHT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.OCR_MAX_USER_IN_FLIGHT} sheets can be queued at once"
+        )
+
+    stats = queue_stats(db)
+    overflow = stats["queue_depth"] + job_count - settings.OCR_MAX_QUEUE_DEPTH
+    reason = "queue_full"
+
+    if overflow <= 0:
+        in_flight = db.query(func.count(OCRQueue.id)).filter(
+            OCRQueue.user_id == user_id,
+            OCRQueue.status.in_(ACTIVE_STATUSES)
+        ).scalar()
+        overflow = in_flight + job_count - settings.OCR_MAX_USER_IN_FLIGHT
+        reason = "user_limit"
+        if overflow <= 0:
+            return
+
+    increment("ocr_admission_rejected_total", reason=reason)
+    detail = "OCR queue is full" if reason == "queue_full" else "Too many sheets in progress"
+    raise HTTPException(
+        status_code=429,
+        detail=f"{detail}, please retry later",
+        headers={"Retry-After": str(retry_after(overflow, stats["drain_rate"]))}
+    )
@@ -0,0 +1,97 @@
+"""Groups AI answer extractions for the same exam into one Gemini request.
+
+Sheets are collected per exam for up to ``AI_BATCH_WINDOW_SECONDS`` or until
+``AI_BATCH_MAX_SHEETS`` are waiting, then sent together and the response is
+split back to each caller. Sheets the model leaves out of a batched response
+are retried individually.
+"""
+from typing import Dict, List, Any
+import asyncio
+import logging
+
+from config import settings
+from gemini_client import GeminiAIClient
+from metrics import increment, observe
+
+logger = logging.getLogger(__name__)
+
+class AnswerBatcher:
+    def __init__(self, client: GeminiAIClient):
+        self.client = client
+        self._groups: Dict[str, Dict[str, Any]] = {}
+
+    async def submit(
+        self,
+        group_key: str,
+        extracted_text: str,
+        questions: List[Dict[str, Any]],
+        answer_format: str = "letter"
+    ) -> Dict[str, Any]:
+        """Queue one sheet and wait for its extraction"""
+        group_key = f"{group_key}:{answer_format}"
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        group = self._groups.get(group_key)
+        if group is None:
+            group = {
+                "questions": questions,
+                "answer_format": answer_format,
+                "texts": [],
+                "futures": [],
+                "timer": loop.call_later(settings.AI_BATCH_WINDOW_SECONDS, self._flush, group_key)
+            }
+            self._groups[group_key] = group
+
+        group["texts"].append(extracted_text)
+        group["futures"].append(future)
+        if len(group["texts"]) >= settings.AI_BATCH_MAX_SHEETS:
+            self._flush(group_key)
+
+        return await future
+
+    def _flush(self, group_key: str):
+        group = self._groups.pop(group_key, None)
+        if group is None:
+            return
+        group["timer"].cancel()
+        asyncio.ensure_future(self._run(group))
+
+    async def _run(self, group: Dict[str, Any]):
+        texts, futures, questions = group["texts"], group["futures"], group["questions"]
+        answer_format = group["answer_format"]
+        observe("ai_batch_size", len(texts))
+
+        try:
+            if len(texts) == 1:
+                results = [await self.client.analyze_answers(texts[0], questions, answer_format)]
+            else:
+                results = await self.client.analyze_answers_batch(texts, questions, answer_format)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for text, future, result in zip(texts, futures, results):
+            if future.done():
+                continue
+            if result is None:
+                # Dropped from the batched response; ask for this sheet alone
+                increment("ai_batch_missing_total")
+                asyncio.ensure_future(self._run_single(text, questions, answer_format, future))
+            else:
+                future.set_result(result)
+
+    async def _run_single(
+        self,
+        text: str,
+        questions: List[Dict[str, Any]],
+        answer_format: str,
+        future: asyncio.Future
+    ):
+        try:
+            future.set_result(await self.client.analyze_answers(text, questions, answer_format))
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
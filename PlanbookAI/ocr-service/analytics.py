@@ -0,0 +1,234 @@
+"""Item analysis and score distribution of an exam over its student results.
+
+The answers of every result are loaded once into a dense ``int8`` matrix
+(students x questions, option index or -1 for blank) and all statistics are
+computed on it with NumPy:
+
+- difficulty: share of students answering an item correctly
+- discrimination: difficulty in the top minus the bottom
+  ``ANALYTICS_GROUP_FRACTION`` of students by total score
+- point-biserial: correlation of an item with the score on the other items
+- distractors: how often each option (and blank) was chosen
+- score histogram and percentiles, as percentages of the total points
+
+Matrices are cached per process (LRU of ``ANALYTICS_CACHE_SIZE`` exams). The
+``ocr.completed`` events of the progress stream append new results in place,
+and a full reload happens after ``ANALYTICS_CACHE_TTL_SECONDS`` in case an
+event was missed. Statistics are recomputed from the matrix only after it
+changes or the answer key does.
+"""
+from sqlalchemy.orm import Session
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional
+import json
+import logging
+import threading
+import time
+
+import numpy as np
+
+from models import StudentResult
+from database import SessionLocal
+from config import settings
+from scoring import question_points
+
+logger = logging.getLogger(__name__)
+
+OPTION_LETTERS = "ABCDEFGH"
+BLANK = -1
+PERCENTILES = (10, 25, 50, 75, 90)
+
+def encode_answers(answers: Dict[str, Optional[str]], question_count: int) -> np.ndarray:
+    """One matrix row: option index per question, BLANK where unanswered"""
+    row = np.full(question_count, BLANK, dtype=np.int8)
+    for number, letter in (answers or {}).items():
+        try:
+            index = int(number) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= index < question_count and letter:
+            option = OPTION_LETTERS.find(str(letter).strip().upper()[:1])
+            if option >= 0:
+                row[index] = option
+    return row
+
+def _option_letters(question: Dict[str, Any]) -> str:
+    options = question.get("options")
+    if isinstance(options, dict):
+        letters = "".join(sorted(key for key in options if key in OPTION_LETTERS))
+        if letters:
+            return letters
+    return "ABCD"
+
+def _rounded(values: np.ndarray) -> List[Optional[float]]:
+    return [None if np.isnan(value) else round(float(value), 4) for value in values]
+
+def item_analysis(answers: np.ndarray, questions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Item and score statistics of an answer matrix against an answer key"""
+    students, question_count = answers.shape
+    key = encode_answers({
+        str(number): question.get("correct_answer") for number, question in enumerate(questions, start=1)
+    }, question_count)
+    points = np.array([question_points(question) for question in questions])
+    total_points = float(points.sum())
+
+    correct = (answers == key) & (key != BLANK)
+    scores = correct @ points
+    percentages = scores / total_points * 100 if total_points else np.zeros(students)
+
+    # Option counts per question in one pass: column index * options + option
+    option_count = len(OPTION_LETTERS)
+    chosen = answers != BLANK
+    flat = (np.nonzero(chosen)[1] * option_count + answers[chosen]).astype(np.int64)
+    option_counts = np.bincount(flat, minlength=question_count * option_count).reshape(question_count, option_count)
+    blank_counts = students - chosen.sum(axis=0)
+
+    difficulty = correct.mean(axis=0) if students else np.full(question_count, np.nan)
+    discrimination = np.full(question_count, np.nan)
+    point_biserial = np.full(question_count, np.nan)
+
+    group = int(round(students * settings.ANALYTICS_GROUP_FRACTION))
+    if students >= 2 and group >= 1:
+        order = np.argsort(scores, kind="stable")
+        discrimination = correct[order[-group:]].mean(axis=0) - correct[order[:group]].mean(axis=0)
+
+        # Against the rest score, so an item is not correlated with itself
+        item_scores = correct * points
+        rest = scores[:, None] - item_scores
+        item_centered = item_scores - item_scores.mean(axis=0)
+        rest_centered = rest - rest.mean(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # NaN (reported as null) when everyone got the item right or wrong
+            point_biserial = (item_centered * rest_centered).sum(axis=0) / np.sqrt(
+                (item_centered ** 2).sum(axis=0) * (rest_centered ** 2).sum(axis=0)
+            )
+
+    bins = settings.ANALYTICS_HISTOGRAM_BINS
+    histogram, edges = np.histogram(percentages, bins=bins, range=(0, 100))
+    distribution = {
+        "mean": round(float(percentages.mean()), 2),
+        "std": round(float(percentages.std()), 2),
+        "min": round(float(percentages.min()), 2),
+        "max": round(float(percentages.max()), 2),
+        "percentiles": {
+            f"p{p}": round(float(value), 2)
+            for p, value in zip(PERCENTILES, np.percentile(percentages, PERCENTILES))
+        }
+    } if students else None
+
+    difficulty, discrimination, point_biserial = map(_rounded, (difficulty, discrimination, point_biserial))
+    items = []
+    for index, question in enumerate(questions):
+        letters = _option_letters(question)
+        # Letters outside the key's options still show up if students marked them
+        shown = sorted(set(letters) | {OPTION_LETTERS[i] for i in np.nonzero(option_counts[index])[0]})
+        items.append({
+            "number": index + 1,
+            "question_id": question.get("id"),
+            "correct_answer": question.get("correct_answer"),
+            "difficulty": difficulty[index],
+            "discrimination": discrimination[index],
+            "point_biserial": point_biserial[index],
+            "options": {letter: int(option_counts[index, OPTION_LETTERS.index(letter)]) for letter in shown},
+            "blank": int(blank_counts[index])
+        })
+
+    return {
+        "student_count": students,
+        "question_count": question_count,
+        "total_points": total_points,
+        "scores": distribution,
+        "histogram": {
+            "edges": [round(float(edge), 2) for edge in edges],
+            "counts": histogram.tolist()
+        },
+        "items": items
+    }
+
+class ExamAnswers:
+    """Answer matrix of one exam, grown in place as results arrive"""
+
+    def __init__(self, question_count: int):
+        self.question_count = question_count
+        self.matrix = np.full((64, question_count), BLANK, dtype=np.int8)
+        self.size = 0
+        self.result_ids = set()
+        self.loaded_at = time.monotonic()
+        # (answer key, statistics) for the current matrix
+        self.stats = None
+
+    @property
+    def answers(self) -> np.ndarray:
+        return self.matrix[:self.size]
+
+    def add(self, result_id: str, answers: Dict[str, Optional[str]]) -> bool:
+        if result_id in self.result_ids:
+            return False
+        if self.size == len(self.matrix):
+            grown = np.full((len(self.matrix) * 2, self.question_count), BLANK, dtype=np.int8)
+            grown[:self.size] = self.matrix
+            self.matrix = grown
+        self.matrix[self.size] = encode_answers(answers, self.question_count)
+        self.size += 1
+        self.result_ids.add(result_id)
+        self.stats = None
+        return True
+
+class AnalyticsCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._exams: "OrderedDict[str, ExamAnswers]" = OrderedDict()
+
+    def _load(self, db: Session, exam_id: str, question_count: int) -> ExamAnswers:
+        exam = ExamAnswers(question_count)
+        rows = db.query(StudentResult.id, StudentResult.answers).filter(
+            StudentResult.exam_id == exam_id
+        ).order_by(StudentResult.created_at).all()
+        for result_id, answers in rows:
+            exam.add(str(result_id), answers)
+        logger.info(f"Loaded {exam.size} results of exam {exam_id} for analytics")
+        return exam
+
+    def analysis(self, db: Session, exam_id: str, questions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Statistics of an exam, loading its results on first use"""
+        with self._lock:
+            exam = self._exams.get(exam_id)
+            expired = exam is not None and time.monotonic() - exam.loaded_at > settings.ANALYTICS_CACHE_TTL_SECONDS
+            if exam is None or expired or exam.question_count != len(questions):
+                exam = self._load(db, exam_id, len(questions))
+                self._exams[exam_id] = exam
+                while len(self._exams) > settings.ANALYTICS_CACHE_SIZE:
+                    self._exams.popitem(last=False)
+            self._exams.move_to_end(exam_id)
+
+            key = json.dumps(questions, sort_keys=True, default=str)
+            if exam.stats is None or exam.stats[0] != key:
+                exam.stats = (key, item_analysis(exam.answers, questions))
+            return exam.stats[1]
+
+    def add_result(self, exam_id: str, result_id: str):
+        """Append one new result to a cached exam; uncached exams load on demand"""
+        with self._lock:
+            if exam_id not in self._exams:
+                return
+        db = SessionLocal()
+        try:
+            answers = db.query(StudentResult.answers).filter(StudentResult.id == result_id).scalar()
+        finally:
+            db.close()
+        if answers is None:
+            return
+        with self._lock:
+            exam = self._exams.get(exam_id)
+            if exam is not None:
+                exam.add(result_id, answers)
+
+    def handle_event(self, event: Dict[str, Any]):
+        """progress_stream listener for ocr.completed"""
+        if event.get("event_type") != "ocr.completed":
+            return
+        data = event.get("data") or {}
+        if data.get("exam_id") and data.get("student_result_id"):
+            self.add_result(data["exam_id"], data["student_result_id"])
+
+cache = AnalyticsCache()
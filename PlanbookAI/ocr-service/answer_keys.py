@@ -0,0 +1,168 @@
+"""Exam answer keys fetched from exam-service and cached per exam in Redis.
+
+All worker processes read the same cached key, so grading a whole batch of
+sheets costs one exam-service call. When the key is missing only one process
+fetches it while the others wait for it to appear. The ``exam.updated``,
+``exam.published`` and ``exam.deleted`` events published by exam-service drop
+the cached key (see ``start_event_consumer``).
+"""
+from typing import Dict, List, Any, Optional
+import json
+import logging
+import threading
+import time
+
+import pika
+import requests
+
+from config import settings
+from utils import get_redis, create_service_token
+from metrics import increment
+
+logger = logging.getLogger(__name__)
+
+REDIS_PREFIX = "ocr:answer-key:"
+LOCK_PREFIX = "ocr:answer-key-lock:"
+GENERATION_PREFIX = "ocr:answer-key-gen:"
+
+INVALIDATING_EVENTS = ("exam.updated", "exam.published", "exam.deleted")
+
+class AnswerKeyError(Exception):
+    """The key could not be loaded; transient unless retrying cannot help"""
+
+    def __init__(self, message: str, transient: bool = True):
+        super().__init__(message)
+        self.transient = transient
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+def _exam_lock(exam_id: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(exam_id, threading.Lock())
+
+def fetch_answer_key(exam_id: str) -> List[Dict[str, Any]]:
+    """One call to exam-service for the ordered questions of an exam"""
+    try:
+        response = requests.get(
+            f"{settings.EXAM_SERVICE_URL}/exams/{exam_id}/answer-key",
+            headers={"Authorization": f"Bearer {create_service_token()}"},
+            timeout=settings.ANSWER_KEY_FETCH_TIMEOUT
+        )
+    except requests.RequestException as e:
+        raise AnswerKeyError(f"Exam service unavailable: {e}")
+
+    increment("answer_key_fetches_total", status=str(response.status_code))
+    if response.status_code != 200:
+        # A missing exam or a rejected request fails the same way next time
+        transient = response.status_code >= 500 or response.status_code in (408, 429)
+        raise AnswerKeyError(
+            f"Answer key for exam {exam_id} unavailable: HTTP {response.status_code}", transient
+        )
+
+    questions = response.json().get("questions") or []
+    if not questions:
+        raise AnswerKeyError(f"Exam {exam_id} has no questions", transient=False)
+    return questions
+
+def _read_cached(client, exam_id: str) -> Optional[List[Dict[str, Any]]]:
+    cached = client.get(REDIS_PREFIX + exam_id)
+    return json.loads(cached) if cached is not None else None
+
+def get_answer_key(exam_id: str) -> List[Dict[str, Any]]:
+    """Questions of an exam in order, with correct_answer and points"""
+    try:
+        client = get_redis()
+        questions = _read_cached(client, exam_id)
+    except Exception as e:
+        logger.warning(f"Answer key cache unavailable: {e}")
+        increment("answer_key_requests_total", result="uncached")
+        return fetch_answer_key(exam_id)
+
+    if questions is None:
+        # Jobs of this process wait here; other processes wait on the Redis lock
+        with _exam_lock(exam_id):
+            questions = _read_cached(client, exam_id)
+            if questions is None:
+                increment("answer_key_requests_total", result="miss")
+                return _load_shared(client, exam_id)
+
+    increment("answer_key_requests_total", result="hit")
+    return questions
+
+def _load_shared(client, exam_id: str) -> List[Dict[str, Any]]:
+    """Fetch under a cross-process lock so only one worker calls exam-service"""
+    wait_seconds = settings.ANSWER_KEY_FETCH_TIMEOUT * 2
+    deadline = time.monotonic() + wait_seconds
+
+    locked = client.set(LOCK_PREFIX + exam_id, "1", nx=True, ex=int(wait_seconds) + 1)
+    while not locked:
+        time.sleep(0.1)
+        questions = _read_cached(client, exam_id)
+        if questions is not None:
+            return questions
+        if time.monotonic() > deadline:
+            # The holder died or exam-service is slow; fetch without the lock
+            break
+        locked = client.set(LOCK_PREFIX + exam_id, "1", nx=True, ex=int(wait_seconds) + 1)
+
+    try:
+        generation = client.get(GENERATION_PREFIX + exam_id)
+        questions = fetch_answer_key(exam_id)
+        # Do not cache a key that was invalidated while it was being fetched
+        if client.get(GENERATION_PREFIX + exam_id) == generation:
+            client.setex(
+                REDIS_PREFIX + exam_id,
+                settings.ANSWER_KEY_TTL_SECONDS,
+                json.dumps(questions, ensure_ascii=False)
+            )
+        return questions
+    finally:
+        if locked:
+            client.delete(LOCK_PREFIX + exam_id)
+
+def invalidate(exam_id: str):
+    pipeline = get_redis().pipeline(transaction=True)
+    pipeline.incr(GENERATION_PREFIX + exam_id)
+    pipeline.delete(REDIS_PREFIX + exam_id)
+    pipeline.execute()
+    logger.info(f"Answer key cache invalidated for exam {exam_id}")
+
+def start_event_consumer():
+    """Listen to exam_events and drop cached keys of changed exams, reconnecting if RabbitMQ drops"""
+    while True:
+        try:
+            credentials = pika.PlainCredentials('admin', 'admin123')
+            parameters = pika.ConnectionParameters(
+                host='rabbitmq',
+                credentials=credentials
+            )
+            connection = pika.BlockingConnection(parameters)
+            channel = connection.channel()
+            channel.queue_declare(queue='exam_events', durable=True)
+
+            def callback(ch, method, properties, body):
+                try:
+                    event = json.loads(body)
+                    if event.get('event_type') in INVALIDATING_EVENTS:
+                        invalidate(event['data']['exam_id'])
+                    ch.basic_ack(delivery_tag=method.delivery_tag)
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.error(f"Malformed exam event: {e}")
+                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+                except Exception as e:
+                    logger.error(f"Error processing exam event: {e}")
+                    # Redis may be briefly down; keep the event so the key is still dropped
+                    time.sleep(1)
+                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+
+            channel.basic_consume(
+                queue='exam_events',
+                on_message_callback=callback
+            )
+
+            logger.info("Started consuming exam_events")
+            channel.start_consuming()
+        except Exception as e:
+            logger.error(f"Exam event consumer stopped: {e}")
+        time.sleep(5)
@@ -0,0 +1,93 @@
+"""Split bulk uploads (multi-page PDF or ZIP of images) into per-page jobs.
+
+PDF pages are not rasterized here: each job points at the stored PDF and a
+page number, and the worker renders its page on demand. ZIP entries are
+streamed one at a time into the blob store, after ``count_batch_pages`` has
+been checked against the limits so a rejected upload writes no pages.
+"""
+from PIL import Image
+from typing import Dict, Any, Iterator, List, Optional
+import zipfile
+import fitz
+
+from config import settings
+from utils import detect_image_format
+from blob_store import BlobWriter, blob_path
+
+def detect_batch_format(header: bytes) -> Optional[str]:
+    if header.startswith(b"%PDF"):
+        return "pdf"
+    if header.startswith(b"PK\x03\x04"):
+        return "zip"
+    return None
+
+def iter_pdf_pages(digest: str) -> Iterator[Dict[str, Any]]:
+    """Yield one page reference per PDF page"""
+    with fitz.open(blob_path(digest)) as document:
+        page_count = document.page_count
+
+    for page_number in range(1, page_count + 1):
+        yield {
+            "image_digest": digest,
+            "image_size": None,
+            "source_type": "pdf_page",
+            "page_number": page_number
+        }
+
+def zip_image_entries(archive: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    """Entries of a ZIP that are images within the upload size limit, by name"""
+    entries = []
+    for info in sorted(archive.infolist(), key=lambda info: info.filename):
+        if info.is_dir() or info.file_size > settings.OCR_MAX_UPLOAD_BYTES:
+            continue
+        with archive.open(info) as entry:
+            if detect_image_format(entry.read(settings.OCR_UPLOAD_CHUNK_BYTES)):
+                entries.append(info)
+    return entries
+
+def count_batch_pages(digest: str, batch_format: str) -> int:
+    """Number of pages iter_batch_pages will yield, without storing any"""
+    if batch_format == "pdf":
+        with fitz.open(blob_path(digest)) as document:
+            return document.page_count
+    with zipfile.ZipFile(blob_path(digest)) as archive:
+        return len(zip_image_entries(archive))
+
+def iter_zip_images(digest: str, created: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+    """Stream each image entry of a ZIP into the blob store.
+
+    Digests of blobs that did not exist before are appended to created.
+    """
+    with zipfile.ZipFile(blob_path(digest)) as archive:
+        for page_number, info in enumerate(zip_image_entries(archive), start=1):
+            with archive.open(info) as entry:
+                writer = BlobWriter()
+                try:
+                    chunk = entry.read(settings.OCR_UPLOAD_CHUNK_BYTES)
+                    while chunk:
+                        writer.write(chunk)
+                        chunk = entry.read(settings.OCR_UPLOAD_CHUNK_BYTES)
+                    image_digest, image_size = writer.commit()
+                except Exception:
+                    writer.abort()
+                    raise
+
+            if writer.created and created is not None:
+                created.append(image_digest)
+            yield {
+                "image_digest": image_digest,
+                "image_size": image_size,
+                "source_type": "image",
+                "page_number": page_number
+            }
+
+def iter_batch_pages(digest: str, batch_format: str, created: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+    if batch_format == "pdf":
+        return iter_pdf_pages(digest)
+    return iter_zip_images(digest, created)
+
+def render_pdf_page(digest: str, page_number: int) -> Image.Image:
+    """Rasterize a single PDF page for OCR"""
+    with fitz.open(blob_path(digest)) as document:
+        pixmap = document.load_page(page_number - 1).get_pixmap(dpi=settings.OCR_PDF_DPI)
+        return Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
@@ -0,0 +1,86 @@
+"""Page throughput benchmark for the OCR process pool.
+
+Run with ``python benchmark.py --workers 1,2,4,8``. Renders synthetic filled
+bubble sheets into the blob store, then grades them through pools of each
+size with ``analyze_page`` and prints sheets per second, so the pool size and
+``OCR_THREADS_PER_PROCESS`` can be tuned on the target host. ``--mode ocr``
+skips the bubble reader and OCRs the whole page instead (needs Tesseract).
+No database or RabbitMQ is needed; the sheets go to a temporary blob store
+that is removed afterwards.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from PIL import ImageDraw
+import argparse
+import io
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from config import settings
+from omr import render_answer_sheet, bubble_centers, DEFAULT_LAYOUT
+from blob_store import put_bytes
+from page_pipeline import analyze_page, init_pool_process
+
+def make_sheets(count: int, num_questions: int) -> list:
+    """Store count distinct filled sheets and return their page jobs"""
+    jobs = []
+    radius = DEFAULT_LAYOUT.bubble_radius - 2
+    centers = bubble_centers(DEFAULT_LAYOUT, num_questions)
+    for index in range(count):
+        rnd = random.Random(index)
+        sheet = render_answer_sheet(num_questions, title=f"Sheet {index + 1}")
+        draw = ImageDraw.Draw(sheet)
+        for question in range(num_questions):
+            x, y = centers[question, rnd.randrange(len(DEFAULT_LAYOUT.options))]
+            draw.ellipse([x - radius, y - radius, x + radius, y + radius], fill=0)
+
+        buffer = io.BytesIO()
+        sheet.save(buffer, "JPEG", quality=85)
+        digest, _ = put_bytes(buffer.getvalue())
+        jobs.append({"source_type": "image", "image_digest": digest, "page_number": None, "image_data": None})
+    return jobs
+
+def run(jobs: list, workers: int, threads: int, num_questions: int) -> float:
+    """Sheets per second through a pool of the given size"""
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_pool_process,
+        initargs=(threads,)
+    )
+    with pool:
+        # Warm up every process so start-up and model loading are not timed
+        list(pool.map(analyze_page, jobs[:workers], [num_questions] * workers,
+                      [[]] * workers, [None] * workers, [False] * workers))
+
+        started = time.perf_counter()
+        list(pool.map(analyze_page, jobs, [num_questions] * len(jobs),
+                      [[]] * len(jobs), [None] * len(jobs), [False] * len(jobs)))
+        return len(jobs) / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated pool sizes")
+    parser.add_argument("--threads", type=int, default=1, help="threads per pool process")
+    parser.add_argument("--sheets", type=int, default=64)
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--mode", choices=("omr", "ocr"), default="omr")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="ocr-benchmark-") as blob_dir:
+        # Pool processes are spawned and read the blob store location from the environment
+        settings.BLOB_STORE_DIR = os.environ["BLOB_STORE_DIR"] = blob_dir
+
+        jobs = make_sheets(args.sheets, args.questions)
+        # Without questions analyze_page skips the bubble reader and OCRs the page
+        num_questions = args.questions if args.mode == "omr" else 0
+
+        print(f"{args.sheets} sheets, mode={args.mode}, threads/process={args.threads}")
+        for workers in (int(value) for value in args.workers.split(",")):
+            rate = run(jobs, workers, args.threads, num_questions)
+            print(f"workers={workers:<3} {rate:8.1f} sheets/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Content-addressed storage for answer-sheet images.
+
+Blobs are keyed by their SHA-256 digest and sharded into
+``<BLOB_STORE_DIR>/ab/cd/<digest>`` so identical uploads are stored once.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, Tuple, Optional
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+
+from config import settings
+
+def blob_path(digest: str) -> str:
+    return os.path.join(settings.BLOB_STORE_DIR, digest[:2], digest[2:4], digest)
+
+def blob_exists(digest: str) -> bool:
+    return os.path.exists(blob_path(digest))
+
+def put_bytes(data: bytes) -> Tuple[str, int]:
+    """Store data and return (digest, size); existing blobs are not rewritten"""
+    digest = hashlib.sha256(data).hexdigest()
+    path = blob_path(digest)
+
+    if not touch_blob(digest):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file in the same directory so the rename is atomic
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    return digest, len(data)
+
+def touch_blob(digest: str) -> bool:
+    """Mark an existing blob as just stored so compaction keeps it; False if missing"""
+    try:
+        os.utime(blob_path(digest))
+        return True
+    except FileNotFoundError:
+        return False
+
+class BlobWriter:
+    """Incrementally write a blob while hashing it, without holding it in memory"""
+
+    def __init__(self):
+        incoming_dir = os.path.join(settings.BLOB_STORE_DIR, ".incoming")
+        os.makedirs(incoming_dir, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=incoming_dir)
+        self._file = os.fdopen(fd, "wb")
+        self._hash = hashlib.sha256()
+        self.size = 0
+        # Set by commit: False when identical content was already stored
+        self.created = False
+
+    def write(self, chunk: bytes):
+        self._hash.update(chunk)
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self) -> Tuple[str, int]:
+        """Move the blob to its content address and return (digest, size)"""
+        self._file.close()
+        digest = self._hash.hexdigest()
+        path = blob_path(digest)
+
+        if touch_blob(digest):
+            # Identical content is already stored
+            os.unlink(self.tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self.tmp_path, path)
+            self.created = True
+
+        return digest, self.size
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
+
+@contextmanager
+def open_blob(digest: str):
+    """Memory-map a stored blob read-only; the map is closed on exit"""
+    with open(blob_path(digest), "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+def blob_mtime(digest: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(blob_path(digest))
+    except FileNotFoundError:
+        return None
+
+def move_blob(digest: str, target_dir: str) -> int:
+    """Move a blob to the same layout under target_dir and return its size"""
+    path = blob_path(digest)
+    target = os.path.join(target_dir, digest[:2], digest[2:4], digest)
+    try:
+        size = os.path.getsize(path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(path, target)
+        return size
+    except FileNotFoundError:
+        return 0
+
+def delete_blob(digest: str) -> int:
+    """Remove a blob and return the bytes reclaimed"""
+    path = blob_path(digest)
+    try:
+        size = os.path.getsize(path)
+        os.unlink(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+def iter_blobs() -> Iterator[Tuple[str, float]]:
+    """(digest, mtime) of every stored blob; temp files are skipped"""
+    for root, dirs, files in os.walk(settings.BLOB_STORE_DIR):
+        dirs[:] = [name for name in dirs if not name.startswith(".")]
+        for name in files:
+            if name.startswith("."):
+                continue
+            try:
+                yield name, os.path.getmtime(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+
+def remove_temp_files(cutoff: datetime) -> int:
+    """Delete temp files of interrupted writes last touched before cutoff; returns bytes"""
+    reclaimed = 0
+    for root, _, files in os.walk(settings.BLOB_STORE_DIR):
+        incoming = os.path.basename(root) == ".incoming"
+        for name in files:
+            if not (incoming or name.startswith(".tmp-")):
+                continue
+            path = os.path.join(root, name)
+            try:
+                if datetime.utcfromtimestamp(os.path.getmtime(path)) < cutoff:
+                    size = os.path.getsize(path)
+                    os.unlink(path)
+                    reclaimed += size
+            except FileNotFoundError:
+                continue
+    return reclaimed
@@ -0,0 +1,217 @@
+"""Compaction of finished OCR jobs, so ``ocr_queue`` holds little beyond live work.
+
+Two steps, each in chunks of ``OCR_COMPACTION_CHUNK_SIZE`` rows with one short
+transaction per chunk (rows locked by a worker are skipped, not waited for):
+
+1. Jobs finished more than ``OCR_IMAGE_RETENTION_DAYS`` ago lose their image:
+   the legacy base64/URL columns are cleared and the blob is deleted, or moved
+   to ``OCR_COLD_STORAGE_DIR``, once no remaining job refers to it.
+2. Jobs finished more than ``OCR_ROW_RETENTION_DAYS`` ago are copied to
+   ``ocr_queue_archive`` (unless ``OCR_ARCHIVE_ROWS`` is off) and deleted.
+3. Blobs older than ``OCR_ORPHAN_BLOB_HOURS`` that no job refers to, such as
+   those of uploads rejected after storing or ZIP archives whose pages were
+   extracted, are released too, along with abandoned temp files.
+
+Blobs stored again within the image retention are kept, since a new upload
+of the same content may be about to reference them. Postgres reuses the
+space of deleted rows after autovacuum.
+
+Worker 0 runs this every ``OCR_COMPACTION_INTERVAL_SECONDS``; run
+``python compaction.py`` to compact once, e.g. from cron.
+"""
+from sqlalchemy import insert, select, func, literal_column, or_
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+import logging
+
+from models import OCRQueue, OCRQueueArchive
+from database import SessionLocal
+from config import settings
+from blob_store import blob_mtime, delete_blob, move_blob, iter_blobs, remove_temp_files
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Dead-lettered jobs keep their images until they are replayed; failed jobs
+# lose theirs and can then no longer be replayed (see job_queue.has_image)
+FINISHED_STATUSES = ("completed", "failed")
+
+ARCHIVED_COLUMNS = (
+    "id", "exam_id", "user_id", "batch_id", "page_number", "source_type", "duplicate_of",
+    "status", "attempts", "result", "error_message",
+    "processing_started_at", "processing_completed_at", "created_at"
+)
+
+def _finished_before(cutoff: datetime):
+    return (
+        OCRQueue.status.in_(FINISHED_STATUSES),
+        OCRQueue.processing_completed_at < cutoff
+    )
+
+def release_blobs(db: Session, digests: Iterable[str], cutoff: datetime) -> int:
+    """Delete or move blobs no job refers to any more; returns bytes reclaimed"""
+    reclaimed = 0
+    for digest in digests:
+        if db.query(OCRQueue.id).filter(OCRQueue.image_digest == digest).first():
+            continue
+        # Checked after the query so a concurrent re-upload keeps the blob
+        mtime = blob_mtime(digest)
+        if mtime is None or datetime.utcfromtimestamp(mtime) >= cutoff:
+            continue
+        if settings.OCR_COLD_STORAGE_DIR:
+            reclaimed += move_blob(digest, settings.OCR_COLD_STORAGE_DIR)
+        else:
+            reclaimed += delete_blob(digest)
+    return reclaimed
+
+def discard_blobs(db: Session, digests: Iterable[str]) -> int:
+    """Delete blobs written by a request that created no job for them"""
+    reclaimed = 0
+    for digest in digests:
+        if not db.query(OCRQueue.id).filter(OCRQueue.image_digest == digest).first():
+            reclaimed += delete_blob(digest)
+    return reclaimed
+
+def strip_images(db: Session, cutoff: datetime) -> Dict[str, int]:
+    """Drop the images of jobs finished before cutoff"""
+    report = {"images_stripped": 0, "payload_bytes": 0, "blob_bytes": 0}
+    payload_size = (
+        func.coalesce(func.octet_length(OCRQueue.image_data), 0)
+        + func.coalesce(func.octet_length(OCRQueue.image_url), 0)
+    )
+
+    while True:
+        rows = db.query(OCRQueue.id, OCRQueue.image_digest, payload_size).filter(
+            *_finished_before(cutoff),
+            or_(
+                OCRQueue.image_digest.isnot(None),
+                OCRQueue.image_data.isnot(None),
+                OCRQueue.image_url.isnot(None)
+            )
+        ).limit(settings.OCR_COMPACTION_CHUNK_SIZE).with_for_update(of=OCRQueue, skip_locked=True).all()
+        if not rows:
+            break
+
+        db.query(OCRQueue).filter(OCRQueue.id.in_([row[0] for row in rows])).update({
+            "image_data": None,
+            "image_url": None,
+            "image_digest": None
+        }, synchronize_session=False)
+        db.commit()
+
+        report["images_stripped"] += len(rows)
+        report["payload_bytes"] += sum(row[2] for row in rows)
+        report["blob_bytes"] += release_blobs(db, {row[1] for row in rows if row[1]}, cutoff)
+
+    return report
+
+def archive_rows(db: Session, cutoff: datetime, image_cutoff: datetime) -> Dict[str, int]:
+    """Move jobs finished before cutoff out of ocr_queue"""
+    report = {"rows_removed": 0, "row_bytes": 0, "blob_bytes": 0}
+
+    while True:
+        rows = db.query(
+            OCRQueue.id, OCRQueue.image_digest,
+            func.pg_column_size(literal_column(f"{OCRQueue.__tablename__}.*"))
+        ).filter(
+            *_finished_before(cutoff)
+        ).limit(settings.OCR_COMPACTION_CHUNK_SIZE).with_for_update(of=OCRQueue, skip_locked=True).all()
+        if not rows:
+            break
+
+        ids = [row[0] for row in rows]
+        if settings.OCR_ARCHIVE_ROWS:
+            columns = [getattr(OCRQueue, name) for name in ARCHIVED_COLUMNS]
+            db.execute(insert(OCRQueueArchive).from_select(
+                list(ARCHIVED_COLUMNS), select(*columns).where(OCRQueue.id.in_(ids))
+            ))
+        db.query(OCRQueue).filter(OCRQueue.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+
+        report["rows_removed"] += len(rows)
+        report["row_bytes"] += sum(row[2] for row in rows)
+        report["blob_bytes"] += release_blobs(db, {row[1] for row in rows if row[1]}, image_cutoff)
+
+    return report
+
+def release_orphans(db: Session, cutoff: datetime) -> Dict[str, int]:
+    """Release stored blobs last written before cutoff that no job refers to"""
+    report = {"orphan_blobs": 0, "blob_bytes": remove_temp_files(cutoff)}
+
+    def release_chunk(digests):
+        referenced = {row[0] for row in db.query(OCRQueue.image_digest).filter(OCRQueue.image_digest.in_(digests))}
+        orphans = [digest for digest in digests if digest not in referenced]
+        db.commit()
+        if orphans:
+            # release_blobs checks references and age again, per blob
+            report["blob_bytes"] += release_blobs(db, orphans, cutoff)
+            report["orphan_blobs"] += sum(blob_mtime(digest) is None for digest in orphans)
+
+    chunk = []
+    for digest, mtime in iter_blobs():
+        if datetime.utcfromtimestamp(mtime) >= cutoff:
+            continue
+        chunk.append(digest)
+        if len(chunk) >= settings.OCR_COMPACTION_CHUNK_SIZE:
+            release_chunk(chunk)
+            chunk = []
+    if chunk:
+        release_chunk(chunk)
+    return report
+
+def compact_queue(db: Session) -> Dict[str, int]:
+    """Run all compaction steps and report what was reclaimed"""
+    now = datetime.utcnow()
+    report = {
+        "images_stripped": 0, "rows_removed": 0, "orphan_blobs": 0,
+        "payload_bytes": 0, "blob_bytes": 0, "row_bytes": 0
+    }
+    # Blobs of archived rows are only released once their image retention has passed too
+    image_cutoff = now - timedelta(days=settings.OCR_IMAGE_RETENTION_DAYS) if settings.OCR_IMAGE_RETENTION_DAYS else now
+
+    if settings.OCR_IMAGE_RETENTION_DAYS:
+        for key, value in strip_images(db, image_cutoff).items():
+            report[key] += value
+
+    if settings.OCR_ROW_RETENTION_DAYS:
+        row_cutoff = now - timedelta(days=settings.OCR_ROW_RETENTION_DAYS)
+        for key, value in archive_rows(db, row_cutoff, image_cutoff).items():
+            report[key] += value
+
+    if settings.OCR_ORPHAN_BLOB_HOURS:
+        orphan_cutoff = now - timedelta(hours=settings.OCR_ORPHAN_BLOB_HOURS)
+        for key, value in release_orphans(db, orphan_cutoff).items():
+            report[key] += value
+
+    report["reclaimed_bytes"] = report["payload_bytes"] + report["blob_bytes"] + report["row_bytes"]
+
+    metrics.increment("ocr_compaction_images_total", report["images_stripped"])
+    metrics.increment("ocr_compaction_rows_total", report["rows_removed"])
+    metrics.increment("ocr_compaction_orphan_blobs_total", report["orphan_blobs"])
+    for kind in ("payload", "blob", "row"):
+        metrics.increment("ocr_compaction_reclaimed_bytes_total", report[f"{kind}_bytes"], kind=kind)
+    return report
+
+def run_compaction() -> Optional[Dict[str, int]]:
+    """Compact in a session of its own; errors are logged and retried next run"""
+    db = SessionLocal()
+    try:
+        report = compact_queue(db)
+        logger.info(
+            f"OCR queue compaction: {report['images_stripped']} images dropped, "
+            f"{report['rows_removed']} rows removed, {report['orphan_blobs']} orphaned blobs released, "
+            f"{report['reclaimed_bytes']} bytes reclaimed"
+        )
+        return report
+    except Exception as e:
+        logger.error(f"OCR queue compaction failed: {e}")
+        db.rollback()
+        return None
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(run_compaction())
+    metrics.flush()
@@ -0,0 +1,95 @@
+"""Detection of re-scanned answer sheets.
+
+All sheets of an exam share one printed layout, so whole-page similarity
+cannot tell a re-scan from another student's sheet: with a 256-bit dHash of
+the page, sheets of different students that differ in 1-10 answers were as
+close as re-scans of one sheet. Detection therefore works in two steps:
+
+- At upload, only byte-identical images (the same blob digest) match. Only
+  these may reuse an earlier result (``on_duplicate=reuse``).
+- After grading, a sheet is a re-scan of an earlier graded sheet of the exam
+  when the student header read from both matches (student ID, else the folded
+  name) and at most ``OCR_DUPLICATE_MAX_ANSWER_DIFF`` decoded answers differ.
+  Such sheets are only flagged.
+
+On synthetic bubble sheets re-scanned with rotation, exposure, scale and
+JPEG noise, every re-scan the reader detected decoded to the same answers,
+while sheets with 1, 3, 5 or 10 different answers decoded to exactly that
+many differences. A sheet without a readable header is never flagged after
+grading, since two students with the same answers could not be told apart.
+
+Graded results carry their folded header (``student_id_key`` and
+``student_name_key``), so the earlier sheets of a student are found through
+expression indexes on those keys rather than by reading every sheet of the
+exam.
+"""
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from typing import Dict, Any, Optional
+
+from models import OCRQueue
+from config import settings
+from roster_match import fold, fold_student_id
+
+EXCLUDED_STATUSES = ("failed", "dead_letter")
+
+def find_exact_duplicate(db: Session, exam_id: str, image_digest: str):
+    """An earlier job of the exam with the same image, preferring a completed one"""
+    return db.query(OCRQueue.id, OCRQueue.status).filter(
+        OCRQueue.exam_id == exam_id,
+        OCRQueue.image_digest == image_digest,
+        OCRQueue.status.notin_(EXCLUDED_STATUSES)
+    ).order_by((OCRQueue.status == "completed").desc(), OCRQueue.created_at).first()
+
+def student_keys(result: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    """Folded student ID and name stored with a result, None when not read"""
+    return {
+        "student_id_key": fold_student_id(result.get("student_id")) or None,
+        "student_name_key": fold(result.get("student_name")) or None
+    }
+
+def same_student_filter(keys: Dict[str, Optional[str]]):
+    """Rows naming the same student: by ID when both sheets have one, else by name"""
+    id_key = OCRQueue.result["student_id_key"].astext
+    name_key = OCRQueue.result["student_name_key"].astext
+    conditions = []
+    if keys["student_id_key"]:
+        conditions.append(id_key == keys["student_id_key"])
+    if keys["student_name_key"]:
+        by_name = name_key == keys["student_name_key"]
+        if keys["student_id_key"]:
+            by_name = and_(by_name, id_key.is_(None))
+        conditions.append(by_name)
+    return or_(*conditions)
+
+def answer_differences(first: Dict[str, Any], second: Dict[str, Any]) -> int:
+    return sum(first.get(number) != second.get(number) for number in set(first) | set(second))
+
+def find_rescan(db: Session, ocr_queue: OCRQueue, result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The earlier graded sheet of the exam that result is a re-scan of, if any"""
+    keys = student_keys(result)
+    if not (keys["student_id_key"] or keys["student_name_key"]):
+        return None
+
+    # Uses ix_ocr_queue_exam_student_id_key / ix_ocr_queue_exam_student_name_key
+    rows = db.query(OCRQueue.id, OCRQueue.result["answers"]).filter(
+        OCRQueue.exam_id == ocr_queue.exam_id,
+        OCRQueue.status == "completed",
+        OCRQueue.id != ocr_queue.id,
+        same_student_filter(keys)
+    ).order_by(OCRQueue.processing_completed_at).all()
+    answers = result.get("answers") or {}
+    for ocr_id, other_answers in rows:
+        differences = answer_differences(answers, other_answers or {})
+        if differences <= settings.OCR_DUPLICATE_MAX_ANSWER_DIFF:
+            return {"ocr_id": str(ocr_id), "answer_differences": differences}
+    return None
+
+def flag_rescan(db: Session, ocr_queue: OCRQueue, result: Dict[str, Any]):
+    """Record in result (and duplicate_of) the sheet this one re-scans"""
+    match = find_rescan(db, ocr_queue, result)
+    if match is None:
+        return
+    result["duplicate"] = {**match, "match": "rescan", "action": "flagged"}
+    if ocr_queue.duplicate_of is None:
+        ocr_queue.duplicate_of = match["ocr_id"]
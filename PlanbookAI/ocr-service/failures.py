@@ -0,0 +1,68 @@
+"""Classification of grading failures by stage.
+
+Every failure of ``process_grading_task`` is attributed to the stage it
+happened in and classified as transient (worth retrying later) or permanent:
+
+- answer_key: fetching the exam's answer key (transient while exam-service is
+  down; a missing exam or one without questions is permanent)
+- preprocess: loading, hashing and bubble-reading the image
+- ocr: text recognition of the page or template regions
+- ai: Gemini answer extraction and feedback (transient)
+- persist: saving the result (transient for connection errors)
+
+Broken images and OCR errors fail for good, while a crashed pool process,
+a timeout or a lost connection are retried.
+"""
+from concurrent.futures.process import BrokenProcessPool
+from PIL import UnidentifiedImageError
+from sqlalchemy.exc import OperationalError, DBAPIError
+import asyncio
+import random
+
+import requests
+
+from config import settings
+from answer_keys import AnswerKeyError
+
+STAGES = ("answer_key", "preprocess", "ocr", "ai", "persist")
+TRANSIENT_STAGES = ("answer_key", "ai")
+
+class StageError(Exception):
+    """A failure attributed to a stage; picklable so it can leave the process pool"""
+
+    def __init__(self, stage: str, transient: bool, message: str):
+        super().__init__(stage, transient, message)
+        self.stage = stage
+        self.transient = transient
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+def is_transient(stage: str, error: BaseException) -> bool:
+    if isinstance(error, AnswerKeyError):
+        return error.transient
+    if isinstance(error, (UnidentifiedImageError, FileNotFoundError)):
+        return False
+    if isinstance(error, DBAPIError):
+        return isinstance(error, OperationalError) or error.connection_invalidated
+    if isinstance(error, (
+        BrokenProcessPool, TimeoutError, asyncio.TimeoutError,
+        ConnectionError, requests.RequestException
+    )):
+        return True
+    return stage in TRANSIENT_STAGES
+
+def classify(stage: str, error: BaseException) -> StageError:
+    """The StageError for an exception raised while in stage"""
+    if isinstance(error, StageError):
+        return error
+    return StageError(stage, is_transient(stage, error), str(error) or type(error).__name__)
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter before attempt number attempts + 1"""
+    delay = min(
+        settings.OCR_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0),
+        settings.OCR_RETRY_MAX_SECONDS
+    )
+    return delay * random.uniform(0.5, 1.0)
@@ -1,27 +1,38 @@
 import google.generativeai as genai
-from typing import Dict, List, Any
+from planbook_shared.gemini import GeminiCaller
+from typing import Dict, List, Any, Optional
 import json
+import logging
+
+from config import settings
+import metrics
+from prompt_encoding import encode_options, encode_incorrect, record_prompt_tokens
+
+logger = logging.getLogger(__name__)
 
 class GeminiAIClient:
     def __init__(self, api_key: str):
         genai.configure(api_key=api_key)
         self.model = genai.GenerativeModel('gemini-pro')
+        self._caller = GeminiCaller(self.model, settings, metrics.registry)
     
     async def analyze_answers(
         self, 
         extracted_text: str, 
-        questions: List[Dict[str, Any]]
+        questions: List[Dict[str, Any]],
+        answer_format: str = "letter"
     ) -> Dict[str, Any]:
-        """Analyze student answers with AI"""
+        """Extract student info and chosen answers; scoring is done locally"""
+        question_block = self._question_block(questions, answer_format)
         
         prompt = f"""
-        Phân tích bài làm của học sinh và chấm điểm.
+        Trích xuất thông tin từ bài làm trắc nghiệm của học sinh.
+        Không chấm điểm, chỉ đọc đáp án học sinh đã chọn.
         
         Văn bản trích xuất từ bài làm:
         {extracted_text}
         
-        Đề bài và đáp án đúng:
-        {json.dumps(questions, ensure_ascii=False, indent=2)}
+        {question_block}
         
         Hãy trả về JSON với format sau:
         {{
@@ -31,29 +42,125 @@ class GeminiAIClient:
                 "1": "A",
                 "2": "B",
                 ...
-            }},
-            "correct_count": số câu đúng,
-            "score": điểm số,
-            "total_points": tổng điểm,
-            "percentage": phần trăm,
-            "feedback": "Nhận xét chi tiết",
-            "incorrect_questions": [danh sách câu sai]
+            }}
         }}
+        Câu không trả lời thì để null.
         """
+        record_prompt_tokens("extraction", prompt, question_block, questions)
         
         try:
-            response = self.model.generate_content(prompt)
-            result_text = response.text
-            
-            # Parse JSON from response
-            # Remove markdown code blocks if present
-            if '```json' in result_text:
-                result_text = result_text.split('```json')[1].split('```')[0]
-            elif '```' in result_text:
-                result_text = result_text.split('```')[1].split('```')[0]
-            
-            result = json.loads(result_text.strip())
-            return result
+            result = self._parse_json(await self._generate(prompt))
+            return {
+                "student_name": result.get("student_name"),
+                "student_id": result.get("student_id"),
+                "answers": result.get("answers") or {}
+            }
             
         except Exception as e:
-            raise Exception(f"AI analysis failed: {e}")
\ No newline at end of file
+            raise Exception(f"AI analysis failed: {e}")
+    
+    async def analyze_answers_batch(
+        self,
+        extracted_texts: List[str],
+        questions: List[Dict[str, Any]],
+        answer_format: str = "letter"
+    ) -> List[Optional[Dict[str, Any]]]:
+        """Extract several sheets of the same exam in one request.
+        
+        Returns one entry per input sheet, None where the model skipped a sheet.
+        """
+        sheets = "\n".join(
+            f"=== BÀI {index} ===\n{text}"
+            for index, text in enumerate(extracted_texts, start=1)
+        )
+        question_block = self._question_block(questions, answer_format)
+        
+        prompt = f"""
+        Trích xuất thông tin từ {len(extracted_texts)} bài làm trắc nghiệm của học sinh.
+        Không chấm điểm, chỉ đọc đáp án học sinh đã chọn.
+        
+        {question_block}
+        
+        Văn bản trích xuất từ các bài làm:
+        {sheets}
+        
+        Hãy trả về một mảng JSON, mỗi bài một phần tử, với format sau:
+        [
+            {{
+                "sheet": số thứ tự bài,
+                "student_name": "Tên học sinh (nếu có trong bài)",
+                "student_id": "Mã số học sinh (nếu có)",
+                "answers": {{"1": "A", "2": "B", ...}}
+            }}
+        ]
+        Câu không trả lời thì để null.
+        """
+        record_prompt_tokens("extraction_batch", prompt, question_block, questions)
+        
+        try:
+            items = self._parse_json(await self._generate(prompt))
+        except Exception as e:
+            raise Exception(f"AI analysis failed: {e}")
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(extracted_texts)
+        for item in items if isinstance(items, list) else []:
+            try:
+                index = int(item.get("sheet")) - 1
+            except (TypeError, ValueError):
+                continue
+            if 0 <= index < len(results):
+                results[index] = {
+                    "student_name": item.get("student_name"),
+                    "student_id": item.get("student_id"),
+                    "answers": item.get("answers") or {}
+                }
+        return results
+    
+    async def generate_feedback(
+        self,
+        questions: List[Dict[str, Any]],
+        answers: Dict[str, Any],
+        scoring: Dict[str, Any]
+    ) -> str:
+        """Write feedback for an already scored sheet (optional second call)"""
+        incorrect = encode_incorrect(questions, answers, scoring["incorrect_questions"])
+        
+        prompt = f"""
+        Viết nhận xét ngắn gọn (tối đa 5 câu) cho học sinh bằng tiếng Việt.
+        Điểm: {scoring["score"]}/{scoring["total_points"]} ({scoring["percentage"]}%)
+        Các câu làm sai (câu:đáp án đúng, HS: đáp án học sinh chọn, nội dung câu hỏi):
+        {incorrect}
+        Chỉ trả về nội dung nhận xét.
+        """
+        record_prompt_tokens("feedback", prompt, incorrect, questions)
+        
+        try:
+            return (await self._generate(prompt)).strip()
+        except Exception as e:
+            raise Exception(f"AI feedback failed: {e}")
+    
+    @staticmethod
+    def _question_block(questions: List[Dict[str, Any]], answer_format: str) -> str:
+        """Question count, plus option text only for sheets answered in words"""
+        block = f"Số câu hỏi: {len(questions)} (đánh số từ 1 đến {len(questions)})"
+        if answer_format == "text":
+            block += (
+                "\nHọc sinh có thể ghi nội dung đáp án thay vì chữ cái; "
+                "hãy quy về chữ cái theo các lựa chọn sau:\n"
+                + encode_options(questions)
+            )
+        return block
+    
+    async def _generate(self, prompt: str) -> str:
+        """Call the model without blocking the event loop, with retries"""
+        return await self._caller.generate(prompt)
+    
+    @staticmethod
+    def _parse_json(result_text: str) -> Any:
+        # Remove markdown code blocks if present
+        if '```json' in result_text:
+            result_text = result_text.split('```json')[1].split('```')[0]
+        elif '```' in result_text:
+            result_text = result_text.split('```')[1].split('```')[0]
+        
+        return json.loads(result_text.strip())
@@ -0,0 +1,219 @@
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Optional
+import asyncio
+import logging
+import uuid
+
+from models import OCRQueue, StudentResult, SheetTemplate
+from config import settings
+from utils import publish_event
+from ocr_processor import format_fields
+from job_queue import extend_lease, job_event_data, record_failure
+from failures import classify
+from page_pipeline import job_image_ref, analyze_page, run_in_pool, ocr_regions_parallel
+from scoring import score_answers, normalize_answers
+from gemini_client import GeminiAIClient
+from ai_batcher import AnswerBatcher
+from answer_keys import get_answer_key
+from metrics import increment
+from duplicates import flag_rescan, student_keys
+import roster_match
+import grading_cache
+
+logger = logging.getLogger(__name__)
+
+# Initialize AI client
+ai_client = GeminiAIClient(api_key=settings.GEMINI_API_KEY)
+ai_batcher = AnswerBatcher(ai_client)
+
+def grade_bubble_sheet(omr_result: dict, exam_questions: list) -> dict:
+    """Score the answers read from a standard bubble sheet"""
+    return {
+        "student_name": None,
+        "student_id": None,
+        "answers": omr_result["answers"],
+        **score_answers(omr_result["answers"], exam_questions),
+        "blank_questions": omr_result["blank_questions"],
+        "multiple_marked_questions": omr_result["multiple_marked_questions"],
+        "grading_method": "omr"
+    }
+
+async def analyze_answers_cached(
+    exam_id: str,
+    extracted_text: str,
+    exam_questions: list,
+    answer_format: str = "letter"
+) -> dict:
+    """AI answer extraction, served from the cache for repeated sheets"""
+    key = grading_cache.cache_key(extracted_text, exam_questions, answer_format)
+    extraction = await asyncio.to_thread(grading_cache.get, key)
+    if extraction is None:
+        # Sheets of the same exam share one batched request
+        extraction = await ai_batcher.submit(exam_id, extracted_text, exam_questions, answer_format)
+        await asyncio.to_thread(grading_cache.put, key, extraction)
+    return extraction
+
+class LeaseLostError(Exception):
+    pass
+
+def find_template(db: Session, exam_id) -> Optional[SheetTemplate]:
+    return db.query(SheetTemplate).filter(SheetTemplate.exam_id == exam_id).first()
+
+def match_roster(db: Session, ocr_queue: OCRQueue, result: dict):
+    """Resolve the extracted student against the job's roster, in place"""
+    match = roster_match.match_student(
+        db, ocr_queue.roster_id, result.get("student_name"), result.get("student_id")
+    )
+    if match is None:
+        return
+    increment("roster_matches_total", status=match["status"], method=match["method"])
+    result["roster_match"] = match
+    if match["status"] == "matched":
+        # Store the roster's spelling; keep what was read for review
+        result["extracted_student"] = {
+            "student_name": result.get("student_name"),
+            "student_id": result.get("student_id")
+        }
+        result["student_name"] = match["full_name"]
+        result["student_id"] = match["student_id"] or result.get("student_id")
+
+def save_result(db: Session, ocr_queue: OCRQueue, worker_id: str, result: dict):
+    """Complete the job and store its student result, unless the lease was lost"""
+    # Another worker reclaimed the job while we were grading it
+    if not extend_lease(db, ocr_queue, worker_id):
+        raise LeaseLostError(f"Lease on {ocr_queue.id} was lost")
+
+    # Identical uploads that reuse this result point at the same student result
+    student_result_id = uuid.uuid4()
+    result["student_result_id"] = str(student_result_id)
+
+    # Save result
+    ocr_queue.result = result
+    ocr_queue.status = "completed"
+    ocr_queue.checkpoint = None
+    ocr_queue.error_message = None
+    ocr_queue.failure_stage = None
+    ocr_queue.lease_expires_at = None
+    ocr_queue.processing_completed_at = datetime.utcnow()
+
+    # Create student result
+    student_result = StudentResult(
+        id=student_result_id,
+        exam_id=ocr_queue.exam_id,
+        student_name=result.get('student_name') or 'Unknown',
+        student_id=result.get('student_id'),
+        answers=result.get('answers'),
+        score=result.get('score'),
+        total_points=result.get('total_points'),
+        percentage=result.get('percentage'),
+        graded_by=ocr_queue.user_id,
+        feedback=result.get('feedback'),
+        graded_at=datetime.utcnow()
+    )
+
+    db.add(student_result)
+    db.commit()
+
+    # Publish completion event
+    publish_event("ocr.completed", job_event_data(
+        ocr_queue, score=result.get('score'), student_result_id=result["student_result_id"]
+    ), queue_name='ocr_queue')
+
+def fail_job(db: Session, ocr_queue: OCRQueue, worker_id: str, failure, checkpoint: dict):
+    db.rollback()
+    # Retry transient failures with backoff; otherwise dead-letter or fail the job
+    if extend_lease(db, ocr_queue, worker_id):
+        record_failure(db, ocr_queue, failure, checkpoint)
+
+async def process_grading_task(db: Session, ocr_queue: OCRQueue, worker_id: str):
+    """Run OCR grading for a claimed queue entry, resuming after its last completed stage.
+    
+    Database, Redis and RabbitMQ calls go through asyncio.to_thread, since the
+    worker's other jobs share this event loop.
+    """
+    ocr_id = ocr_queue.id
+    exam_id = str(ocr_queue.exam_id)
+    # Outputs of completed stages; saved on failure so a retry skips them
+    checkpoint = dict(ocr_queue.checkpoint or {})
+    stage = "answer_key"
+
+    try:
+        # Cached per exam; one exam-service call serves the whole batch
+        exam_questions = await asyncio.to_thread(get_answer_key, exam_id)
+
+        stage = "preprocess"
+        template = await asyncio.to_thread(find_template, db, ocr_queue.exam_id)
+        profile = ocr_queue.preprocess_profile or (template.preprocess_profile if template else None)
+        regions = (template.regions if template else None) or []
+
+        page = checkpoint.get("page")
+        if page is None:
+            # CPU-bound page work runs in the worker's process pool
+            job = job_image_ref(ocr_queue)
+            split_regions = len(regions) > settings.OCR_REGIONS_PER_TASK
+            page = await run_in_pool(
+                analyze_page, job, len(exam_questions), regions, profile, split_regions
+            )
+            if page["omr"] is None and regions and page["fields"] is None:
+                # Large template: OCR its regions on several pool processes
+                stage = "ocr"
+                page["fields"] = await ocr_regions_parallel(job, regions, profile)
+            checkpoint["page"] = page
+
+        fields = page["fields"]
+        if page["omr"] is not None:
+            result = grade_bubble_sheet(page["omr"], exam_questions)
+            if fields is not None:
+                result["fields"] = fields
+                result["student_name"] = fields.get("student_name") or None
+                result["student_id"] = fields.get("student_id") or None
+        else:
+            # Non-standard sheet: fall back to OCR + Gemini
+            stage = "ai"
+            extraction = checkpoint.get("extraction")
+            if extraction is None:
+                # Templates saved without regions yield no fields; read the whole page then
+                extracted_text = format_fields(fields) if fields is not None else page["text"]
+                # The model only reads the answers; scoring stays deterministic
+                answer_format = (template.answer_format if template else None) or "letter"
+                extraction = await analyze_answers_cached(exam_id, extracted_text, exam_questions, answer_format)
+                checkpoint["extraction"] = extraction
+            answers = normalize_answers(extraction["answers"])
+            result = {
+                "student_name": extraction["student_name"],
+                "student_id": extraction["student_id"],
+                "answers": answers,
+                **score_answers(answers, exam_questions),
+                "grading_method": "ai"
+            }
+            if fields is not None:
+                result["fields"] = fields
+
+        if ocr_queue.with_feedback:
+            stage = "ai"
+            if "feedback" not in checkpoint:
+                checkpoint["feedback"] = await ai_client.generate_feedback(
+                    exam_questions, result["answers"], result
+                )
+            result["feedback"] = checkpoint["feedback"]
+
+        stage = "persist"
+        if ocr_queue.roster_id:
+            await asyncio.to_thread(match_roster, db, ocr_queue, result)
+        # Indexed header, compared on the roster's spelling of the student when matched
+        result.update(student_keys(result))
+        if settings.OCR_DUPLICATE_DETECTION:
+            await asyncio.to_thread(flag_rescan, db, ocr_queue, result)
+        await asyncio.to_thread(save_result, db, ocr_queue, worker_id, result)
+
+        logger.info(f"OCR processing completed: {ocr_id}")
+
+    except LeaseLostError as e:
+        logger.warning(str(e))
+        await asyncio.to_thread(db.rollback)
+
+    except Exception as e:
+        failure = classify(stage, e)
+        logger.error(f"Processing error at {failure.stage}: {failure}")
+        await asyncio.to_thread(fail_job, db, ocr_queue, worker_id, failure, checkpoint)
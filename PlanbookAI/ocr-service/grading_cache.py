@@ -0,0 +1,90 @@
+"""Cache of AI answer extractions, keyed by sheet text and answer key.
+
+Re-scans and re-submitted uploads produce the same OCR text, so the Gemini
+round-trip can be skipped. Lookups go to a per-process LRU first, then to
+Redis, which is shared by all workers. Both tiers expire after
+``AI_CACHE_TTL_SECONDS``.
+"""
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional
+import hashlib
+import json
+import logging
+import threading
+import time
+import unicodedata
+
+from config import settings
+from utils import get_redis
+from metrics import increment
+
+logger = logging.getLogger(__name__)
+
+REDIS_PREFIX = "ocr:ai-cache:"
+
+_lock = threading.Lock()
+_local: "OrderedDict[str, tuple]" = OrderedDict()
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so OCR layout jitter does not change the key"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def cache_key(extracted_text: str, questions: List[Dict[str, Any]], answer_format: str = "letter") -> str:
+    text_hash = hashlib.sha256(normalize_text(extracted_text).encode()).hexdigest()
+    key_hash = hashlib.sha256(
+        json.dumps(questions, sort_keys=True, ensure_ascii=False, default=str).encode()
+    ).hexdigest()
+    if answer_format != "letter":
+        key_hash = f"{key_hash}:{answer_format}"
+    return f"{text_hash}:{key_hash}"
+
+def _get_local(key: str) -> Optional[Dict[str, Any]]:
+    with _lock:
+        entry = _local.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del _local[key]
+            return None
+        _local.move_to_end(key)
+        return value
+
+def _put_local(key: str, value: Dict[str, Any]):
+    with _lock:
+        _local[key] = (time.monotonic() + settings.AI_CACHE_TTL_SECONDS, value)
+        _local.move_to_end(key)
+        while len(_local) > settings.AI_CACHE_LOCAL_SIZE:
+            _local.popitem(last=False)
+
+def get(key: str) -> Optional[Dict[str, Any]]:
+    value = _get_local(key)
+    if value is not None:
+        increment("ai_cache_requests_total", result="hit_local")
+        return value
+
+    try:
+        cached = get_redis().get(REDIS_PREFIX + key)
+    except Exception as e:
+        logger.warning(f"AI cache read failed: {e}")
+        cached = None
+
+    if cached is not None:
+        value = json.loads(cached)
+        _put_local(key, value)
+        increment("ai_cache_requests_total", result="hit_redis")
+        return value
+
+    increment("ai_cache_requests_total", result="miss")
+    return None
+
+def put(key: str, value: Dict[str, Any]):
+    _put_local(key, value)
+    try:
+        get_redis().setex(
+            REDIS_PREFIX + key,
+            settings.AI_CACHE_TTL_SECONDS,
+            json.dumps(value, ensure_ascii=False)
+        )
+    except Exception as e:
+        logger.warning(f"AI cache write failed: {e}")
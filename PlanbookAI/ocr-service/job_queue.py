@@ -0,0 +1,234 @@
+"""Lease-based job claiming for the ocr_queue table.
+
+Workers claim disjoint batches with ``SELECT ... FOR UPDATE SKIP LOCKED`` and
+hold each job under a lease. A job whose lease expires (worker crashed or hung)
+becomes claimable again until it has used up ``OCR_MAX_ATTEMPTS``.
+
+Transient failures (see failures.py) put the job back with an exponential
+backoff (``next_attempt_at``) and the outputs of its completed stages in
+``checkpoint``. Jobs out of attempts go to ``dead_letter``, from where
+``replay_jobs`` puts them back in bulk; permanent failures are ``failed``.
+
+Claims are fair-shared between users rather than FIFO: higher ``priority``
+first, then round-robin over users, where a user's rank also counts the jobs
+they already have in progress. One teacher's 300-page batch therefore does not
+hold up another teacher's single sheet.
+"""
+from sqlalchemy import or_, and_, func, select
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+import logging
+
+from models import OCRQueue
+from config import settings
+from utils import publish_event
+from failures import StageError, retry_delay
+
+logger = logging.getLogger(__name__)
+
+def job_event_data(job: OCRQueue, **extra) -> dict:
+    """Common payload of job events, with the ids progress listeners filter on"""
+    return {
+        "ocr_id": str(job.id),
+        "exam_id": str(job.exam_id),
+        "user_id": str(job.user_id),
+        "batch_id": str(job.batch_id) if job.batch_id else None,
+        **extra
+    }
+
+def _lease_expiry() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=settings.OCR_LEASE_SECONDS)
+
+def _lease_expired(now: datetime):
+    return and_(
+        OCRQueue.status == "processing",
+        or_(OCRQueue.lease_expires_at.is_(None), OCRQueue.lease_expires_at < now)
+    )
+
+def _claimable(now: datetime):
+    return and_(
+        or_(
+            and_(
+                OCRQueue.status == "pending",
+                # Retries wait out their backoff
+                or_(OCRQueue.next_attempt_at.is_(None), OCRQueue.next_attempt_at <= now)
+            ),
+            _lease_expired(now)
+        ),
+        func.coalesce(OCRQueue.attempts, 0) < settings.OCR_MAX_ATTEMPTS
+    )
+
+def claim_jobs(db: Session, worker_id: str, batch_size: int) -> List[OCRQueue]:
+    """Claim up to batch_size pending or lease-expired jobs for this worker"""
+    now = datetime.utcnow()
+
+    in_flight = select(
+        OCRQueue.user_id,
+        func.count(OCRQueue.id).label("in_flight")
+    ).where(
+        OCRQueue.status == "processing",
+        OCRQueue.lease_expires_at >= now
+    ).group_by(OCRQueue.user_id).subquery()
+
+    # Position of each job in its owner's queue, after the jobs already running
+    share_rank = func.row_number().over(
+        partition_by=OCRQueue.user_id,
+        order_by=(OCRQueue.priority.desc(), OCRQueue.created_at)
+    ) + func.coalesce(in_flight.c.in_flight, 0)
+
+    ranked = select(
+        OCRQueue.id,
+        share_rank.label("share_rank")
+    ).outerjoin(
+        in_flight, in_flight.c.user_id == OCRQueue.user_id
+    ).where(_claimable(now)).subquery()
+
+    # The claimable filter is repeated outside so rows claimed concurrently are rechecked
+    jobs = db.query(OCRQueue).join(
+        ranked, ranked.c.id == OCRQueue.id
+    ).filter(
+        _claimable(now)
+    ).order_by(
+        OCRQueue.priority.desc(), ranked.c.share_rank, OCRQueue.created_at
+    ).limit(batch_size).with_for_update(of=OCRQueue, skip_locked=True).all()
+
+    lease_expires_at = _lease_expiry()
+    for job in jobs:
+        if job.status == "processing":
+            logger.warning(f"Reclaiming expired lease on {job.id} from {job.worker_id}")
+        job.status = "processing"
+        job.worker_id = worker_id
+        job.lease_expires_at = lease_expires_at
+        job.attempts = (job.attempts or 0) + 1
+        job.next_attempt_at = None
+        job.processing_started_at = now
+        job.updated_at = now
+
+    db.commit()
+
+    for job in jobs:
+        publish_event("ocr.processing", job_event_data(
+            job, worker_id=worker_id, attempts=job.attempts
+        ), queue_name='ocr_queue')
+
+    return jobs
+
+def extend_lease(db: Session, job: OCRQueue, worker_id: str) -> bool:
+    """Renew the lease on a job; returns False if another worker took it over"""
+    return renew_lease(db, job.id, worker_id)
+
+def renew_lease(db: Session, job_id, worker_id: str) -> bool:
+    """extend_lease by id, for callers that do not hold the job's row"""
+    renewed = db.query(OCRQueue).filter(
+        OCRQueue.id == job_id,
+        OCRQueue.worker_id == worker_id,
+        OCRQueue.status == "processing"
+    ).update({
+        "lease_expires_at": _lease_expiry()
+    }, synchronize_session=False)
+    db.commit()
+    return renewed == 1
+
+def record_failure(db: Session, job: OCRQueue, failure: StageError, checkpoint: Optional[Dict[str, Any]]) -> str:
+    """Retry a failed job later, or dead-letter or fail it; returns its new status"""
+    now = datetime.utcnow()
+    attempts = job.attempts or 0
+    job.error_message = str(failure)
+    job.failure_stage = failure.stage
+    job.checkpoint = checkpoint or None
+    job.worker_id = None
+    job.lease_expires_at = None
+    job.updated_at = now
+
+    if failure.transient and attempts < settings.OCR_MAX_ATTEMPTS:
+        delay = retry_delay(attempts)
+        job.status = "pending"
+        job.next_attempt_at = now + timedelta(seconds=delay)
+        db.commit()
+        publish_event("ocr.requeued", job_event_data(
+            job, attempts=attempts, stage=failure.stage, error=str(failure), retry_in=round(delay, 1)
+        ), queue_name='ocr_queue')
+        logger.info(f"OCR job {job.id} failed at {failure.stage}, retrying in {delay:.1f}s")
+        return job.status
+
+    # Out of attempts on a transient error: keep it for replay
+    job.status = "dead_letter" if failure.transient else "failed"
+    job.processing_completed_at = now
+    db.commit()
+    publish_event("ocr.dead_lettered" if failure.transient else "ocr.failed", job_event_data(
+        job, attempts=attempts, stage=failure.stage, error=str(failure)
+    ), queue_name='ocr_queue')
+    logger.error(f"OCR job {job.id} {job.status} at {failure.stage}: {failure}")
+    return job.status
+
+def dead_letter_exhausted_jobs(db: Session) -> int:
+    """Dead-letter lease-expired jobs that have no attempts left"""
+    now = datetime.utcnow()
+
+    jobs = db.query(OCRQueue).filter(
+        _lease_expired(now),
+        func.coalesce(OCRQueue.attempts, 0) >= settings.OCR_MAX_ATTEMPTS
+    ).with_for_update(skip_locked=True).all()
+
+    for job in jobs:
+        job.status = "dead_letter"
+        job.error_message = f"Lease expired after {job.attempts} attempts"
+        job.lease_expires_at = None
+        job.processing_completed_at = now
+        job.updated_at = now
+
+    db.commit()
+
+    for job in jobs:
+        logger.error(f"OCR job {job.id} exhausted its attempts")
+        publish_event("ocr.dead_lettered", job_event_data(
+            job, attempts=job.attempts, error=job.error_message
+        ), queue_name='ocr_queue')
+
+    return len(jobs)
+
+def has_image():
+    """Jobs whose image is still stored; compaction removes it from old finished jobs"""
+    return or_(OCRQueue.image_digest.isnot(None), OCRQueue.image_data.isnot(None))
+
+def replay_jobs(db: Session, filters: list, limit: int, from_start: bool = False) -> int:
+    """Put matching dead-lettered or failed jobs back in the queue with fresh attempts.
+
+    Checkpoints are kept unless from_start is set, so replays resume where
+    the job stopped. Jobs whose image was compacted away are left alone.
+    """
+    jobs = db.query(OCRQueue.id, OCRQueue.user_id, OCRQueue.exam_id, OCRQueue.batch_id).filter(
+        *filters, has_image()
+    ).order_by(OCRQueue.created_at).limit(limit).with_for_update(skip_locked=True).all()
+    if not jobs:
+        return 0
+
+    values = {
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": None,
+        "worker_id": None,
+        "lease_expires_at": None,
+        "processing_completed_at": None,
+        "updated_at": datetime.utcnow()
+    }
+    if from_start:
+        values["checkpoint"] = None
+    db.query(OCRQueue).filter(OCRQueue.id.in_([job.id for job in jobs])).update(values, synchronize_session=False)
+    db.commit()
+
+    # One event per owner and batch rather than per job
+    groups: Dict[tuple, int] = {}
+    for job in jobs:
+        key = (str(job.user_id), str(job.exam_id), str(job.batch_id) if job.batch_id else None)
+        groups[key] = groups.get(key, 0) + 1
+    for (user_id, exam_id, batch_id), count in groups.items():
+        publish_event("ocr.replayed", {
+            "user_id": user_id,
+            "exam_id": exam_id,
+            "batch_id": batch_id,
+            "count": count
+        }, queue_name='ocr_queue')
+
+    return len(jobs)
@@ -1,25 +1,48 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Request, Query
+from fastapi.responses import JSONResponse, Response, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import insert, func, tuple_, not_
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 import uvicorn
-import logging
+import asyncio
 import base64
-from PIL import Image
+import binascii
+import logging
 import io
+import uuid
 
-from models import OCRQueue, OCRQueueCreate, OCRQueueResponse, StudentResult
+from models import (
+    OCRQueue, OCRQueueArchive, OCRBatch, SheetTemplate, StudentResult, ClassRoster,
+    OCRQueueCreate, OCRQueueResponse, OCRBatchResponse,
+    SheetTemplateCreate, SheetTemplateResponse, ClassRosterCreate, ClassRosterResponse
+)
 from database import get_db, engine, Base
 from config import settings
-from utils import get_current_user, publish_event
-from ocr_processor import process_ocr_image
-from gemini_client import GeminiAIClient
+from utils import get_current_user, get_stream_user, create_stream_token, publish_event, detect_image_format
+from blob_store import BlobWriter
+from omr import render_answer_sheet, DEFAULT_LAYOUT
+from batch_ingest import detect_batch_format, count_batch_pages, iter_batch_pages
+from preprocessing import PROFILES
+from prompt_encoding import ANSWER_FORMATS
+from answer_keys import start_event_consumer, get_answer_key, AnswerKeyError
+from duplicates import find_exact_duplicate
+from job_queue import job_event_data, replay_jobs, has_image
+from admission import check_admission, queue_stats
+from compaction import discard_blobs
+from schema_upgrade import upgrade_schema
+import progress_stream
+import analytics
+import roster_match
+import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 Base.metadata.create_all(bind=engine)
+upgrade_schema(engine)
 
 app = FastAPI(title="OCR Service", version="1.0.0")
 
@@ -31,175 +54,542 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize AI client
-ai_client = GeminiAIClient(api_key=settings.GEMINI_API_KEY)
+# Drop cached answer keys when exams change (in production, use separate worker)
+import threading
+threading.Thread(target=start_event_consumer, daemon=True).start()
+threading.Thread(target=progress_stream.start_event_consumer, daemon=True).start()
+metrics.start_flusher()
+progress_stream.add_listener(analytics.cache.handle_event)
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Refuse oversized uploads from Content-Length before the body is read"""
+    if request.method == "POST" and request.url.path.startswith("/ocr/upload"):
+        if request.url.path.startswith("/ocr/upload/batch"):
+            max_bytes = settings.OCR_MAX_BATCH_UPLOAD_BYTES
+        else:
+            max_bytes = settings.OCR_MAX_UPLOAD_BYTES
+        content_length = request.headers.get("content-length")
+        # Allow some headroom for the multipart envelope
+        if content_length and content_length.isdigit() and \
+                int(content_length) > max_bytes + 64 * 1024:
+            return JSONResponse(status_code=413, content={"detail": "File too large"})
+    return await call_next(request)
+
+async def stream_upload_to_blob(file: UploadFile, max_bytes: int, detect_format, error_detail: str):
+    """Copy an upload into the blob store in chunks, validating only its header.
+    
+    Returns (digest, size, format) where format comes from detect_format(header).
+    """
+    # Reject oversized files before copying anything
+    if file.size and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail="File too large")
+    
+    header = await file.read(settings.OCR_UPLOAD_CHUNK_BYTES)
+    file_format = detect_format(header)
+    if not file_format:
+        raise HTTPException(status_code=400, detail=error_detail)
+    
+    # Stream to the blob store while hashing
+    writer = BlobWriter()
+    try:
+        chunk = header
+        while chunk:
+            if writer.size + len(chunk) > max_bytes:
+                raise HTTPException(status_code=413, detail="File too large")
+            writer.write(chunk)
+            chunk = await file.read(settings.OCR_UPLOAD_CHUNK_BYTES)
+        digest, size = writer.commit()
+    except Exception:
+        writer.abort()
+        raise
+    
+    return digest, size, file_format
+
+def resolve_priority(priority: Optional[int], default: int, current_user: dict) -> int:
+    """Requested claim priority; default is also the ceiling, except for admins and managers.
+    
+    Single uploads default to OCR_INTERACTIVE_PRIORITY and batches to
+    OCR_BATCH_PRIORITY, so other users cannot move a bulk batch ahead of
+    interactive uploads.
+    """
+    if priority is None:
+        return default
+    if current_user['role'] not in ['admin', 'manager']:
+        return min(priority, default)
+    return priority
+
+def validate_profile(preprocess_profile: Optional[str]):
+    if preprocess_profile and preprocess_profile not in PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown preprocessing profile: {preprocess_profile}")
+
+DUPLICATE_ACTIONS = ("flag", "reuse")
+
+def release_upload_blobs(db: Session, digests: list):
+    """Delete blobs of an upload that no job uses; a failure only leaves them to compaction"""
+    try:
+        discard_blobs(db, digests)
+    except Exception as e:
+        logger.error(f"Could not release upload blobs: {e}")
+
+def load_roster(db: Session, roster_id: str, current_user: dict) -> ClassRoster:
+    roster = db.query(ClassRoster).filter(ClassRoster.id == roster_id).first()
+    if not roster:
+        raise HTTPException(status_code=404, detail="Roster not found")
+    if str(roster.created_by) != current_user['id']:
+        if current_user['role'] not in ['admin', 'manager']:
+            raise HTTPException(status_code=403, detail="Access denied")
+    return roster
+
+def roster_entries(roster_data: ClassRosterCreate, previous: Optional[list] = None) -> list:
+    """Stored roster students; entries kept from the previous version keep their ids"""
+    if len(roster_data.students) > settings.ROSTER_MAX_STUDENTS:
+        raise HTTPException(status_code=400, detail=f"A roster holds at most {settings.ROSTER_MAX_STUDENTS} students")
+    
+    previous_ids = {}
+    for entry in previous or []:
+        previous_ids.setdefault(roster_match.fold_student_id(entry.get("student_id")) or roster_match.fold(entry["full_name"]), entry["id"])
+    
+    entries, seen = [], set()
+    for student in roster_data.students:
+        folded_id = roster_match.fold_student_id(student.student_id)
+        if folded_id and folded_id in seen:
+            raise HTTPException(status_code=400, detail=f"Duplicate student ID: {student.student_id}")
+        seen.add(folded_id)
+        key = folded_id or roster_match.fold(student.full_name)
+        entries.append({
+            "id": previous_ids.pop(key, None) or str(uuid.uuid4()),
+            "student_id": student.student_id,
+            "full_name": student.full_name.strip()
+        })
+    return entries
 
 @app.post("/ocr/upload", response_model=OCRQueueResponse)
 async def upload_for_grading(
     exam_id: str,
+    preprocess_profile: Optional[str] = None,
+    with_feedback: Optional[bool] = None,
+    on_duplicate: Optional[str] = None,
+    priority: Optional[int] = Query(None, ge=0, le=100),
+    roster_id: Optional[str] = None,
     file: UploadFile = File(...),
-    background_tasks: BackgroundTasks = None,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Upload answer sheet image for OCR grading"""
+    """Upload answer sheet image for OCR grading.
+    
+    An identical image uploaded earlier for the exam is reported in the response;
+    with on_duplicate=reuse its completed result is reused without grading.
+    Re-scans that are not byte-identical are flagged in the result once graded.
+    """
     try:
-        # Validate file type
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image")
+        validate_profile(preprocess_profile)
+        on_duplicate = on_duplicate or settings.OCR_DUPLICATE_ACTION
+        if on_duplicate not in DUPLICATE_ACTIONS:
+            raise HTTPException(status_code=400, detail=f"Unknown duplicate action: {on_duplicate}")
+        if roster_id:
+            load_roster(db, roster_id, current_user)
+        check_admission(db, current_user['id'])
         
-        # Read and validate image
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
+        # Only the header is inspected; the image is decoded by the worker
+        image_digest, image_size, _ = await stream_upload_to_blob(
+            file, settings.OCR_MAX_UPLOAD_BYTES, detect_image_format, "File must be an image"
+        )
         
-        # Convert to base64
-        buffered = io.BytesIO()
-        image.save(buffered, format=image.format or 'PNG')
-        image_base64 = base64.b64encode(buffered.getvalue()).decode()
+        match = None
+        if settings.OCR_DUPLICATE_DETECTION:
+            match = find_exact_duplicate(db, exam_id, image_digest)
         
         # Create OCR queue entry
         ocr_queue = OCRQueue(
             exam_id=exam_id,
             user_id=current_user['id'],
-            image_url=f"data:image/{image.format.lower()};base64,{image_base64[:50]}...",
-            image_data=image_base64,
+            image_digest=image_digest,
+            image_size=image_size,
+            preprocess_profile=preprocess_profile,
+            with_feedback=settings.OCR_AI_FEEDBACK if with_feedback is None else with_feedback,
+            priority=resolve_priority(priority, settings.OCR_INTERACTIVE_PRIORITY, current_user),
+            roster_id=roster_id,
             status="pending"
         )
         
+        duplicate = None
+        if match:
+            match_id, match_status = match
+            ocr_queue.duplicate_of = match_id
+            duplicate = {
+                "ocr_id": match_id,
+                "status": match_status,
+                "match": "exact",
+                "action": "flagged"
+            }
+            
+            if on_duplicate == "reuse" and match_status == "completed":
+                # Same image already graded: no OCR or AI pass, same student result
+                matched_result = db.query(OCRQueue.result).filter(OCRQueue.id == match_id).scalar()
+                ocr_queue.result = {**matched_result, "duplicate_of": str(match_id)}
+                ocr_queue.status = "completed"
+                ocr_queue.processing_completed_at = datetime.utcnow()
+                duplicate["action"] = "reused"
+        
         db.add(ocr_queue)
         db.commit()
         db.refresh(ocr_queue)
         
-        # Add to background processing
-        if background_tasks:
-            background_tasks.add_task(
-                process_grading_task,
-                ocr_queue.id,
-                image_base64,
-                exam_id
-            )
+        # Grading is picked up by the OCR workers (worker.py)
         
         # Publish event
-        publish_event("ocr.uploaded", {
-            "ocr_id": str(ocr_queue.id),
-            "exam_id": exam_id,
-            "user_id": current_user['id']
-        }, queue_name='ocr_queue')
+        if ocr_queue.status == "completed":
+            publish_event("ocr.completed", job_event_data(
+                ocr_queue, score=ocr_queue.result.get('score'),
+                student_result_id=ocr_queue.result.get('student_result_id')
+            ), queue_name='ocr_queue')
+        else:
+            publish_event("ocr.uploaded", job_event_data(ocr_queue), queue_name='ocr_queue')
         
+        if duplicate:
+            logger.info(f"OCR upload {ocr_queue.id} {duplicate['action']} as duplicate of {duplicate['ocr_id']}")
         logger.info(f"OCR job created: {ocr_queue.id}")
         
-        return ocr_queue
+        response = OCRQueueResponse.model_validate(ocr_queue)
+        response.duplicate = duplicate
+        return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Upload error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-async def process_grading_task(ocr_id: str, image_data: str, exam_id: str):
-    """Background task to process OCR grading"""
-    db = next(get_db())
-    
+@app.post("/ocr/upload/batch", response_model=OCRBatchResponse)
+async def upload_batch_for_grading(
+    exam_id: str,
+    preprocess_profile: Optional[str] = None,
+    with_feedback: bool = False,
+    priority: Optional[int] = Query(None, ge=0, le=100),
+    roster_id: Optional[str] = None,
+    file: UploadFile = File(...),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Upload a multi-page PDF or a ZIP of answer sheet images"""
     try:
-        # Get OCR queue entry
-        ocr_queue = db.query(OCRQueue).filter(OCRQueue.id == ocr_id).first()
-        if not ocr_queue:
-            logger.error(f"OCR queue {ocr_id} not found")
-            return
-        
-        # Update status to processing
-        ocr_queue.status = "processing"
-        ocr_queue.processing_started_at = datetime.utcnow()
-        db.commit()
+        validate_profile(preprocess_profile)
+        if roster_id:
+            load_roster(db, roster_id, current_user)
+        # Refuse early during peaks; the full page count is checked once known
+        check_admission(db, current_user['id'])
         
-        # Decode image
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Process OCR
-        extracted_text = process_ocr_image(image)
-        
-        # Get exam questions from exam service
-        # (In production, call exam service API)
-        exam_questions = get_exam_questions(exam_id)
-        
-        # Analyze with Gemini AI
-        result = await ai_client.analyze_answers(
-            extracted_text=extracted_text,
-            questions=exam_questions
+        source_digest, _, batch_format = await stream_upload_to_blob(
+            file, settings.OCR_MAX_BATCH_UPLOAD_BYTES, detect_batch_format,
+            "File must be a PDF or a ZIP of images"
         )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Batch upload error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    # Page blobs written for this batch, deleted again if it is rejected
+    created = []
+    try:
+        # PDF parsing and ZIP extraction are blocking, keep them off the event loop
+        page_count = await run_in_threadpool(count_batch_pages, source_digest, batch_format)
+        if not page_count:
+            raise HTTPException(status_code=400, detail="No answer sheets found in file")
+        if page_count > settings.OCR_MAX_BATCH_PAGES:
+            raise HTTPException(status_code=400, detail="Too many pages in batch")
+        check_admission(db, current_user['id'], page_count)
         
-        # Save result
-        ocr_queue.result = result
-        ocr_queue.status = "completed"
-        ocr_queue.processing_completed_at = datetime.utcnow()
-        
-        # Create student result
-        student_result = StudentResult(
+        batch = OCRBatch(
+            id=uuid.uuid4(),
             exam_id=exam_id,
-            student_name=result.get('student_name', 'Unknown'),
-            student_id=result.get('student_id'),
-            answers=result.get('answers'),
-            score=result.get('score'),
-            total_points=result.get('total_points'),
-            percentage=result.get('percentage'),
-            graded_by=ocr_queue.user_id,
-            feedback=result.get('feedback'),
-            graded_at=datetime.utcnow()
+            user_id=current_user['id'],
+            source_type=batch_format,
+            source_digest=source_digest
         )
         
-        db.add(student_result)
-        db.commit()
-        
-        # Publish completion event
-        publish_event("ocr.completed", {
-            "ocr_id": str(ocr_id),
-            "exam_id": exam_id,
-            "score": result.get('score')
-        }, queue_name='ocr_queue')
+        page_priority = resolve_priority(priority, settings.OCR_BATCH_PRIORITY, current_user)
         
-        logger.info(f"OCR processing completed: {ocr_id}")
+        def build_rows():
+            return [
+                {
+                    "id": uuid.uuid4(),
+                    "exam_id": exam_id,
+                    "user_id": current_user['id'],
+                    "batch_id": batch.id,
+                    "preprocess_profile": preprocess_profile,
+                    "with_feedback": with_feedback,
+                    "priority": page_priority,
+                    "roster_id": roster_id,
+                    "status": "pending",
+                    **page
+                }
+                for page in iter_batch_pages(source_digest, batch_format, created)
+            ]
         
-    except Exception as e:
-        logger.error(f"Processing error: {e}")
+        rows = await run_in_threadpool(build_rows)
         
-        # Update status to failed
-        ocr_queue.status = "failed"
-        ocr_queue.error_message = str(e)
-        ocr_queue.processing_completed_at = datetime.utcnow()
+        batch.total_pages = len(rows)
+        db.add(batch)
+        db.flush()
+        db.execute(insert(OCRQueue), rows)
         db.commit()
-        
-        publish_event("ocr.failed", {
-            "ocr_id": str(ocr_id),
-            "error": str(e)
-        }, queue_name='ocr_queue')
-
-def get_exam_questions(exam_id: str):
-    """Get exam questions (mock for now)"""
-    # In production, call exam service API
-    return [
-        {
-            "id": "1",
-            "question_text": "What is H2O?",
-            "correct_answer": "A",
-            "options": {"A": "Water", "B": "Salt", "C": "Sugar", "D": "Air"}
-        }
-    ]
+        db.refresh(batch)
+    except Exception as e:
+        db.rollback()
+        release_upload_blobs(db, created + [source_digest])
+        if isinstance(e, HTTPException):
+            raise
+        logger.error(f"Batch upload error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if batch_format == "zip":
+        # The pages are stored on their own; nothing reads the archive again
+        release_upload_blobs(db, [source_digest])
+    
+    publish_event("ocr.batch_uploaded", {
+        "batch_id": str(batch.id),
+        "exam_id": exam_id,
+        "user_id": current_user['id'],
+        "total_pages": batch.total_pages
+    }, queue_name='ocr_queue')
+    
+    logger.info(f"OCR batch created: {batch.id} ({batch.total_pages} pages)")
+    
+    return batch
+
+@app.get("/ocr/batch/{batch_id}")
+async def get_batch_progress(
+    batch_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get aggregate progress and per-page results of a batch"""
+    batch = db.query(OCRBatch).filter(OCRBatch.id == batch_id).first()
+    
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    
+    if str(batch.user_id) != current_user['id']:
+        if current_user['role'] not in ['admin', 'manager']:
+            raise HTTPException(status_code=403, detail="Access denied")
+    
+    status_counts = dict(
+        db.query(OCRQueue.status, func.count(OCRQueue.id))
+        .filter(OCRQueue.batch_id == batch.id)
+        .group_by(OCRQueue.status)
+        .all()
+    )
+    
+    pages = db.query(
+        OCRQueue.id, OCRQueue.page_number, OCRQueue.status,
+        OCRQueue.result, OCRQueue.error_message
+    ).filter(OCRQueue.batch_id == batch.id).order_by(OCRQueue.page_number).all()
+    
+    finished = sum(status_counts.get(status, 0) for status in progress_stream.TERMINAL_STATUSES)
+    
+    return {
+        "id": batch.id,
+        "exam_id": batch.exam_id,
+        "total_pages": batch.total_pages,
+        "status_counts": status_counts,
+        "progress": round(finished / batch.total_pages * 100, 2) if batch.total_pages else 0.0,
+        "pages": [
+            {
+                "id": page.id,
+                "page_number": page.page_number,
+                "status": page.status,
+                "result": page.result,
+                "error_message": page.error_message
+            }
+            for page in pages
+        ]
+    }
+
+@app.post("/ocr/events/token")
+async def create_ocr_events_token(current_user: dict = Depends(get_current_user)):
+    """Token for GET /ocr/events?token=..., since EventSource cannot send headers.
+    
+    It only opens event streams and expires after OCR_STREAM_TOKEN_SECONDS, so
+    a reconnect after that needs a new one.
+    """
+    return {
+        "token": create_stream_token(current_user),
+        "expires_in": settings.OCR_STREAM_TOKEN_SECONDS
+    }
+
+@app.get("/ocr/events")
+async def stream_ocr_events(
+    request: Request,
+    batch_id: Optional[str] = None,
+    ocr_id: Optional[str] = None,
+    current_user: dict = Depends(get_stream_user),
+    db: Session = Depends(get_db)
+):
+    """Server-Sent Events stream of job status changes, optionally for one batch or job.
+    
+    Authenticates with the Authorization header or, for browser EventSource
+    clients, a ``token`` from POST /ocr/events/token.
+    """
+    see_all = current_user['role'] in ['admin', 'manager']
+    
+    if ocr_id:
+        owner = db.query(OCRQueue.user_id).filter(OCRQueue.id == ocr_id).scalar()
+        if owner is None:
+            raise HTTPException(status_code=404, detail="OCR job not found")
+        if str(owner) != current_user['id'] and not see_all:
+            raise HTTPException(status_code=403, detail="Access denied")
+    elif batch_id:
+        batch = db.query(OCRBatch.user_id).filter(OCRBatch.id == batch_id).first()
+        if not batch:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        if str(batch.user_id) != current_user['id'] and not see_all:
+            raise HTTPException(status_code=403, detail="Access denied")
+    
+    # Subscribe before reading the current state, so no change falls in between;
+    # buffered events the snapshot already reflects are dropped by job id and status
+    subscription = progress_stream.hub.subscribe(current_user['id'], see_all, batch_id, ocr_id)
+    try:
+        if ocr_id:
+            job_id, status = db.query(OCRQueue.id, OCRQueue.status).filter(OCRQueue.id == ocr_id).one()
+            snapshot = {"ocr_id": ocr_id, "status": status}
+            statuses = {str(job_id): status}
+        else:
+            query = db.query(OCRQueue.id, OCRQueue.status)
+            if batch_id:
+                query = query.filter(OCRQueue.batch_id == batch_id)
+            else:
+                query = query.filter(
+                    OCRQueue.user_id == current_user['id'],
+                    OCRQueue.status.in_(["pending", "processing"])
+                )
+            statuses = {str(job_id): status for job_id, status in query.all()}
+            status_counts = {}
+            for status in statuses.values():
+                status_counts[status] = status_counts.get(status, 0) + 1
+            snapshot = {"batch_id": batch_id, "status_counts": status_counts}
+        state = progress_stream.StreamState(statuses, batch_id)
+    except Exception:
+        progress_stream.hub.unsubscribe(subscription)
+        raise
+    finally:
+        # Give the connection back now rather than when the stream ends
+        db.close()
+    
+    async def event_stream():
+        try:
+            yield progress_stream.format_sse("snapshot", snapshot)
+            if snapshot.get("status") in progress_stream.TERMINAL_STATUSES:
+                return
+            
+            while True:
+                try:
+                    message = await asyncio.wait_for(
+                        subscription.queue.get(),
+                        timeout=settings.OCR_STREAM_KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                
+                if state.covers(message):
+                    continue
+                state.record(message)
+                yield progress_stream.format_sse("status", message)
+                # A single-job stream ends with the job
+                if ocr_id and message["status"] in progress_stream.TERMINAL_STATUSES:
+                    return
+        finally:
+            progress_stream.hub.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def encode_cursor(created_at: datetime, ocr_id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{ocr_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    """(created_at, id) of the last row of the previous page"""
+    try:
+        created_at, ocr_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(ocr_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @app.get("/ocr/queue", response_model=List[OCRQueueResponse])
 async def list_ocr_queue(
+    response: Response,
     status: Optional[str] = None,
-    skip: int = 0,
-    limit: int = 20,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """List OCR processing queue"""
-    query = db.query(OCRQueue).filter(OCRQueue.user_id == current_user['id'])
+    """List OCR processing queue, newest first.
+
+    Pass the X-Next-Cursor header of a page as ``cursor`` to get the next one.
+    """
+    query = db.query(
+        OCRQueue.id, OCRQueue.exam_id, OCRQueue.user_id, OCRQueue.status, OCRQueue.created_at
+    ).filter(OCRQueue.user_id == current_user['id'])
     
     if status:
         query = query.filter(OCRQueue.status == status)
     
-    items = query.order_by(OCRQueue.created_at.desc()).offset(skip).limit(limit).all()
-    return items
+    if cursor:
+        # Seek past the previous page instead of counting skipped rows
+        query = query.filter(tuple_(OCRQueue.created_at, OCRQueue.id) < decode_cursor(cursor))
+    
+    items = query.order_by(OCRQueue.created_at.desc(), OCRQueue.id.desc()).limit(limit).all()
+    
+    if len(items) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(items[-1].created_at, items[-1].id)
+    return [OCRQueueResponse.model_validate(item) for item in items]
+
+@app.post("/ocr/dead-letter/replay")
+async def replay_dead_letter_jobs(
+    exam_id: Optional[str] = None,
+    batch_id: Optional[str] = None,
+    status: str = "dead_letter",
+    from_start: bool = False,
+    limit: int = Query(settings.OCR_REPLAY_MAX_JOBS, ge=1, le=settings.OCR_REPLAY_MAX_JOBS),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Put dead-lettered (or failed) jobs back in the queue in bulk.
+    
+    Jobs resume after their last completed stage unless from_start is set.
+    Failed jobs older than OCR_IMAGE_RETENTION_DAYS have lost their image and
+    are counted in without_image instead.
+    Admins and managers replay everyone's jobs, other users their own.
+    """
+    if status not in ("dead_letter", "failed"):
+        raise HTTPException(status_code=400, detail="Only dead_letter or failed jobs can be replayed")
+    
+    filters = [OCRQueue.status == status]
+    if current_user['role'] not in ['admin', 'manager']:
+        filters.append(OCRQueue.user_id == current_user['id'])
+    if exam_id:
+        filters.append(OCRQueue.exam_id == exam_id)
+    if batch_id:
+        filters.append(OCRQueue.batch_id == batch_id)
+    
+    replayed = replay_jobs(db, filters, limit, from_start)
+    without_image = db.query(func.count(OCRQueue.id)).filter(*filters, not_(has_image())).scalar()
+    if not replayed and without_image:
+        raise HTTPException(
+            status_code=409,
+            detail=f"The images of {without_image} matching jobs were removed by compaction; upload those sheets again"
+        )
+    logger.info(f"Replayed {replayed} {status} OCR jobs")
+    
+    return {"replayed": replayed, "without_image": without_image}
 
 @app.get("/ocr/result/{ocr_id}")
 async def get_ocr_result(
@@ -208,12 +598,19 @@ async def get_ocr_result(
     db: Session = Depends(get_db)
 ):
     """Get OCR grading result"""
-    ocr_queue = db.query(OCRQueue).filter(OCRQueue.id == ocr_id).first()
+    ocr_queue = db.query(
+        OCRQueue.id, OCRQueue.user_id, OCRQueue.status, OCRQueue.result, OCRQueue.error_message,
+        OCRQueue.created_at, OCRQueue.processing_started_at, OCRQueue.processing_completed_at
+    ).filter(OCRQueue.id == ocr_id).first()
+    
+    if not ocr_queue:
+        # Old jobs are moved out of the live queue by compaction
+        ocr_queue = db.query(OCRQueueArchive).filter(OCRQueueArchive.id == ocr_id).first()
     
     if not ocr_queue:
         raise HTTPException(status_code=404, detail="OCR job not found")
     
-    if ocr_queue.user_id != current_user['id']:
+    if str(ocr_queue.user_id) != current_user['id']:
         if current_user['role'] not in ['admin', 'manager']:
             raise HTTPException(status_code=403, detail="Access denied")
     
@@ -227,6 +624,216 @@ async def get_ocr_result(
         "processing_completed_at": ocr_queue.processing_completed_at
     }
 
+@app.put("/ocr/templates/{exam_id}", response_model=SheetTemplateResponse)
+async def save_sheet_template(
+    exam_id: str,
+    template_data: SheetTemplateCreate,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Create or replace the answer sheet template (OCR regions) of an exam"""
+    validate_profile(template_data.preprocess_profile)
+    if template_data.answer_format not in ANSWER_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown answer format: {template_data.answer_format}")
+    
+    regions = [region.dict() for region in template_data.regions]
+    if not regions:
+        raise HTTPException(status_code=400, detail="A template needs at least one region")
+    names = [region["name"] for region in regions]
+    if len(set(names)) != len(names):
+        raise HTTPException(status_code=400, detail="Region names must be unique")
+    
+    template = db.query(SheetTemplate).filter(SheetTemplate.exam_id == exam_id).first()
+    if template:
+        if str(template.created_by) != current_user['id']:
+            if current_user['role'] not in ['admin', 'manager']:
+                raise HTTPException(status_code=403, detail="Access denied")
+        template.updated_at = datetime.utcnow()
+    else:
+        template = SheetTemplate(exam_id=exam_id, created_by=current_user['id'])
+        db.add(template)
+    
+    template.name = template_data.name
+    template.regions = regions
+    template.preprocess_profile = template_data.preprocess_profile
+    template.answer_format = template_data.answer_format
+    db.commit()
+    db.refresh(template)
+    
+    return template
+
+@app.get("/ocr/templates/{exam_id}", response_model=SheetTemplateResponse)
+async def get_sheet_template(
+    exam_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the answer sheet template of an exam"""
+    template = db.query(SheetTemplate).filter(SheetTemplate.exam_id == exam_id).first()
+    
+    if not template:
+        raise HTTPException(status_code=404, detail="Template not found")
+    
+    return template
+
+@app.delete("/ocr/templates/{exam_id}")
+async def delete_sheet_template(
+    exam_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Delete the answer sheet template of an exam"""
+    template = db.query(SheetTemplate).filter(SheetTemplate.exam_id == exam_id).first()
+    
+    if not template:
+        raise HTTPException(status_code=404, detail="Template not found")
+    
+    if str(template.created_by) != current_user['id']:
+        if current_user['role'] not in ['admin', 'manager']:
+            raise HTTPException(status_code=403, detail="Access denied")
+    
+    db.delete(template)
+    db.commit()
+    
+    return {"message": "Template deleted successfully"}
+
+@app.post("/ocr/rosters", response_model=ClassRosterResponse)
+async def create_roster(
+    roster_data: ClassRosterCreate,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Create a class roster that extracted student names and IDs are matched against"""
+    roster = ClassRoster(
+        name=roster_data.name,
+        students=roster_entries(roster_data),
+        created_by=current_user['id']
+    )
+    db.add(roster)
+    db.commit()
+    db.refresh(roster)
+    
+    return roster
+
+@app.get("/ocr/rosters", response_model=List[ClassRosterResponse])
+async def list_rosters(
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """List the current user's class rosters"""
+    return db.query(ClassRoster).filter(
+        ClassRoster.created_by == current_user['id']
+    ).order_by(ClassRoster.name).all()
+
+@app.get("/ocr/rosters/{roster_id}", response_model=ClassRosterResponse)
+async def get_roster(
+    roster_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get a class roster"""
+    return load_roster(db, roster_id, current_user)
+
+@app.put("/ocr/rosters/{roster_id}", response_model=ClassRosterResponse)
+async def update_roster(
+    roster_id: str,
+    roster_data: ClassRosterCreate,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Replace the students of a class roster"""
+    roster = load_roster(db, roster_id, current_user)
+    roster.name = roster_data.name
+    roster.students = roster_entries(roster_data, roster.students)
+    # Also the version that cached roster indexes are keyed on
+    roster.updated_at = datetime.utcnow()
+    db.commit()
+    db.refresh(roster)
+    
+    return roster
+
+@app.delete("/ocr/rosters/{roster_id}")
+async def delete_roster(
+    roster_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Delete a class roster"""
+    roster = load_roster(db, roster_id, current_user)
+    db.delete(roster)
+    db.commit()
+    
+    return {"message": "Roster deleted successfully"}
+
+@app.get("/ocr/rosters/{roster_id}/match")
+async def match_roster_student(
+    roster_id: str,
+    name: Optional[str] = None,
+    student_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Resolve a student name and/or ID to a roster entry, as grading does"""
+    load_roster(db, roster_id, current_user)
+    return roster_match.match_student(db, roster_id, name, student_id)
+
+@app.get("/ocr/answer-sheet")
+async def get_answer_sheet(
+    num_questions: int = Query(..., ge=1, le=DEFAULT_LAYOUT.max_questions),
+    title: str = "",
+    current_user: dict = Depends(get_current_user)
+):
+    """Download a printable bubble answer sheet (PNG)"""
+    sheet = render_answer_sheet(num_questions, title=title)
+    buffered = io.BytesIO()
+    sheet.save(buffered, format="PNG")
+    return Response(content=buffered.getvalue(), media_type="image/png")
+
+@app.get("/ocr/preprocess-profiles")
+async def list_preprocess_profiles():
+    """Available preprocessing profiles and their stages"""
+    return {
+        "default": settings.OCR_PREPROCESS_PROFILE,
+        "profiles": PROFILES
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics(db: Session = Depends(get_db)):
+    # Refresh the queue gauges on every scrape
+    queue_stats(db, refresh=True)
+    return metrics.render()
+
+@app.get("/ocr/analytics/{exam_id}")
+async def get_exam_analytics(
+    exam_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Item analysis (difficulty, discrimination, distractors) and score distribution of an exam"""
+    if current_user['role'] not in ['admin', 'manager']:
+        graded = db.query(StudentResult.id).filter(
+            StudentResult.exam_id == exam_id,
+            StudentResult.graded_by == current_user['id']
+        ).first()
+        if not graded:
+            raise HTTPException(status_code=403, detail="Access denied")
+    
+    try:
+        questions = await asyncio.to_thread(get_answer_key, exam_id)
+    except AnswerKeyError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    
+    report = await run_in_threadpool(analytics.cache.analysis, db, exam_id, questions)
+    return {"exam_id": exam_id, **report}
+
+@app.get("/ocr/queue/stats")
+async def get_queue_stats(
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Current queue depth, drain rate (jobs/s) and estimated wait"""
+    return queue_stats(db)
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "ocr-service"}
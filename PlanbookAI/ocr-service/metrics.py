@@ -0,0 +1,24 @@
+"""Metrics of the OCR service, flushed to Redis under ``ocr:metrics``.
+
+Thin module-level wrapper over ``planbook_shared.metrics`` so the API, the
+workers and the shared Gemini client all report into the same series.
+"""
+from planbook_shared import metrics as shared_metrics
+
+from utils import get_redis
+
+registry = shared_metrics.Metrics("ocr", get_redis)
+FLUSH_INTERVAL_SECONDS = shared_metrics.FLUSH_INTERVAL_SECONDS
+
+increment = registry.increment
+observe = registry.observe
+set_gauge = registry.set_gauge
+flush = registry.flush
+start_flusher = registry.start_flusher
+render = registry.render
+
+class Timer(shared_metrics.Timer):
+    """Context manager that observes the elapsed seconds of its block"""
+
+    def __init__(self, name: str, **labels):
+        super().__init__(registry, name, **labels)
@@ -1,8 +1,9 @@
-from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, Any, List
 from datetime import datetime
-from sqlalchemy import ( Column, Integer, String, Text, Boolean, Float, Numeric, DateTime, ForeignKey)
+from sqlalchemy import ( Column, Integer, BigInteger, String, Text, Boolean, Float, Numeric, DateTime, ForeignKey, Index)
 from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy.orm import deferred
 from database import Base
 import uuid
 
@@ -12,13 +13,109 @@ class OCRQueue(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     exam_id = Column(UUID(as_uuid=True))
     user_id = Column(UUID(as_uuid=True))
-    image_url = Column(Text)
-    image_data = Column(Text)
+    # Legacy image payloads; only loaded when accessed
+    image_url = deferred(Column(Text))
+    image_data = deferred(Column(Text))
+    image_digest = Column(String(64), index=True)
+    image_size = Column(BigInteger)
+    # Earlier sheet this one re-scans (see duplicates.py)
+    duplicate_of = Column(UUID(as_uuid=True))
+    source_type = Column(String(20), default='image')
+    batch_id = Column(UUID(as_uuid=True), index=True)
+    page_number = Column(Integer)
+    preprocess_profile = Column(String(50))
+    with_feedback = Column(Boolean, default=False)
+    # Class roster the extracted student name/ID is matched against
+    roster_id = Column(UUID(as_uuid=True))
+    # Higher is claimed first; within a priority, users are served round-robin
+    priority = Column(Integer, default=0, server_default='0')
     status = Column(String(50), default='pending')
+    worker_id = Column(String(100))
+    lease_expires_at = Column(DateTime)
+    attempts = Column(Integer, default=0, server_default='0')
+    # Retry backoff; pending jobs are not claimed before this time
+    next_attempt_at = Column(DateTime)
+    # Stage of the last failure and the outputs of the stages completed before it
+    failure_stage = Column(String(20))
+    checkpoint = deferred(Column(JSONB))
+    result = Column(JSONB)
+    error_message = Column(Text)
+    processing_started_at = Column(DateTime)
+    processing_completed_at = Column(DateTime, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ix_ocr_queue_exam_digest', 'exam_id', 'image_digest'),
+        # Re-scan lookup of a student's graded sheets (see duplicates.py)
+        Index(
+            'ix_ocr_queue_exam_student_id_key', 'exam_id', result['student_id_key'].astext,
+            postgresql_where=status == 'completed'
+        ),
+        Index(
+            'ix_ocr_queue_exam_student_name_key', 'exam_id', result['student_name_key'].astext,
+            postgresql_where=status == 'completed'
+        ),
+        # Queue depth for admission control only scans unfinished jobs
+        Index('ix_ocr_queue_active', 'status', postgresql_where=status.in_(['pending', 'processing'])),
+        # Keyset pages of GET /ocr/queue, with and without a status filter
+        Index('ix_ocr_queue_user_status_created', 'user_id', 'status', 'created_at'),
+        Index('ix_ocr_queue_user_created', 'user_id', 'created_at'),
+    )
+
+class OCRQueueArchive(Base):
+    """Finished jobs moved out of ocr_queue by compaction, without their images"""
+    __tablename__ = "ocr_queue_archive"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    exam_id = Column(UUID(as_uuid=True))
+    user_id = Column(UUID(as_uuid=True), index=True)
+    batch_id = Column(UUID(as_uuid=True))
+    page_number = Column(Integer)
+    source_type = Column(String(20))
+    duplicate_of = Column(UUID(as_uuid=True))
+    status = Column(String(50))
+    attempts = Column(Integer)
     result = Column(JSONB)
     error_message = Column(Text)
     processing_started_at = Column(DateTime)
     processing_completed_at = Column(DateTime)
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+class OCRBatch(Base):
+    __tablename__ = "ocr_batches"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    exam_id = Column(UUID(as_uuid=True))
+    user_id = Column(UUID(as_uuid=True), index=True)
+    source_type = Column(String(20))
+    source_digest = Column(String(64))
+    total_pages = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class SheetTemplate(Base):
+    __tablename__ = "sheet_templates"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    exam_id = Column(UUID(as_uuid=True), unique=True, index=True)
+    name = Column(String(255))
+    regions = Column(JSONB)
+    preprocess_profile = Column(String(50))
+    # "letter" for A/B/C/D marks, "text" when students write the option content
+    answer_format = Column(String(20), default='letter')
+    created_by = Column(UUID(as_uuid=True))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class ClassRoster(Base):
+    __tablename__ = "class_rosters"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    name = Column(String(255))
+    # [{"id", "student_id", "full_name"}]
+    students = Column(JSONB)
+    created_by = Column(UUID(as_uuid=True), index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
 
@@ -48,6 +145,68 @@ class OCRQueueResponse(BaseModel):
     user_id: uuid.UUID
     status: str
     created_at: datetime
+    # Set when the upload matched an earlier sheet of the exam
+    duplicate: Optional[Dict[str, Any]] = None
+    
+    class Config:
+        from_attributes = True
+
+class OCRBatchResponse(BaseModel):
+    id: uuid.UUID
+    exam_id: uuid.UUID
+    source_type: str
+    total_pages: int
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class RosterStudent(BaseModel):
+    student_id: Optional[str] = None
+    full_name: str = Field(min_length=1)
+
+class RosterStudentResponse(RosterStudent):
+    id: str
+
+class ClassRosterCreate(BaseModel):
+    name: str
+    students: List[RosterStudent]
+
+class ClassRosterResponse(BaseModel):
+    id: uuid.UUID
+    name: str
+    students: List[RosterStudentResponse]
+    created_at: datetime
+    updated_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class SheetRegion(BaseModel):
+    # Position and size as fractions of the page width/height
+    name: str
+    x: float = Field(ge=0, le=1)
+    y: float = Field(ge=0, le=1)
+    width: float = Field(gt=0, le=1)
+    height: float = Field(gt=0, le=1)
+    psm: int = 6
+    whitelist: Optional[str] = None
+
+class SheetTemplateCreate(BaseModel):
+    name: str
+    regions: List[SheetRegion]
+    preprocess_profile: Optional[str] = None
+    answer_format: str = "letter"
+
+class SheetTemplateResponse(BaseModel):
+    id: uuid.UUID
+    exam_id: uuid.UUID
+    name: str
+    regions: List[SheetRegion]
+    preprocess_profile: Optional[str]
+    answer_format: Optional[str] = "letter"
+    created_at: datetime
+    updated_at: datetime
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
@@ -0,0 +1,103 @@
+"""OCR engine backends.
+
+``TesserocrEngine`` keeps a Tesseract API instance (with the language models
+loaded) alive for the life of the worker process and feeds it images from
+memory. ``PytesseractEngine`` is the original subprocess-per-image backend,
+kept for comparison and as a fallback. Select with ``OCR_ENGINE``.
+"""
+from abc import ABC, abstractmethod
+from PIL import Image
+from typing import Optional
+import logging
+import threading
+
+import pytesseract
+
+from config import settings
+from metrics import Timer
+
+logger = logging.getLogger(__name__)
+
+class OCREngine(ABC):
+    name = "base"
+
+    def __init__(self, lang: str):
+        self.lang = lang
+
+    @abstractmethod
+    def recognize(self, image: Image.Image, psm: int = 6, whitelist: Optional[str] = None) -> str:
+        """Text of image, using page segmentation mode psm"""
+
+    def close(self):
+        pass
+
+class PytesseractEngine(OCREngine):
+    """Forks the tesseract binary for every call"""
+    name = "pytesseract"
+
+    def recognize(self, image: Image.Image, psm: int = 6, whitelist: Optional[str] = None) -> str:
+        config = f"--psm {psm}"
+        if whitelist:
+            config += f" -c tessedit_char_whitelist={whitelist}"
+        with Timer("ocr_engine_seconds", engine=self.name):
+            return pytesseract.image_to_string(image, lang=self.lang, config=config)
+
+class TesserocrEngine(OCREngine):
+    """Long-lived in-process Tesseract API, one instance per thread"""
+    name = "tesserocr"
+
+    def __init__(self, lang: str):
+        super().__init__(lang)
+        # Imported here so the service still runs where tesserocr is not built
+        import tesserocr
+        self._tesserocr = tesserocr
+        self._local = threading.local()
+        self._apis = []
+        self._lock = threading.Lock()
+        # Load the models now rather than on the first sheet
+        self._api()
+
+    def _api(self):
+        api = getattr(self._local, "api", None)
+        if api is None:
+            api = self._tesserocr.PyTessBaseAPI(lang=self.lang)
+            self._local.api = api
+            with self._lock:
+                self._apis.append(api)
+        return api
+
+    def recognize(self, image: Image.Image, psm: int = 6, whitelist: Optional[str] = None) -> str:
+        api = self._api()
+        with Timer("ocr_engine_seconds", engine=self.name):
+            api.SetPageSegMode(psm)
+            api.SetVariable("tessedit_char_whitelist", whitelist or "")
+            api.SetImage(image)
+            text = api.GetUTF8Text()
+            api.Clear()
+        return text
+
+    def close(self):
+        with self._lock:
+            for api in self._apis:
+                api.End()
+            self._apis.clear()
+
+ENGINES = {
+    "pytesseract": PytesseractEngine,
+    "tesserocr": TesserocrEngine,
+}
+
+_engine = None
+
+def get_engine() -> OCREngine:
+    """Process-wide OCR engine, created on first use"""
+    global _engine
+    if _engine is None:
+        engine_class = ENGINES.get(settings.OCR_ENGINE, PytesseractEngine)
+        try:
+            _engine = engine_class(settings.OCR_LANGUAGES)
+        except Exception as e:
+            logger.warning(f"OCR engine {settings.OCR_ENGINE} unavailable, using pytesseract: {e}")
+            _engine = PytesseractEngine(settings.OCR_LANGUAGES)
+        logger.info(f"Using OCR engine: {_engine.name}")
+    return _engine
@@ -1,39 +1,55 @@
-import pytesseract
-from PIL import Image, ImageEnhance, ImageFilter
-import cv2
-import numpy as np
-
-def preprocess_image(image: Image.Image) -> Image.Image:
-    """Preprocess image for better OCR"""
-    # Convert to numpy array
-    img_array = np.array(image)
-    
-    # Convert to grayscale
-    gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-    
-    # Apply threshold
-    _, thresh = cv2.threshold(gray, 150, 255, cv2.THRESH_BINARY)
-    
-    # Denoise
-    denoised = cv2.fastNlMeansDenoising(thresh)
-    
-    # Convert back to PIL Image
-    return Image.fromarray(denoised)
-
-def process_ocr_image(image: Image.Image) -> str:
+from PIL import Image
+from typing import Optional, Dict, List, Any
+
+from config import settings
+from preprocessing import run_pipeline
+from ocr_engine import get_engine
+
+def preprocess_image(image: Image.Image, profile: Optional[str] = None) -> Image.Image:
+    """Preprocess image for better OCR using the given pipeline profile"""
+    return run_pipeline(image, profile or settings.OCR_PREPROCESS_PROFILE)
+
+def process_ocr_image(image: Image.Image, profile: Optional[str] = None) -> str:
     """Process image with OCR"""
     try:
         # Preprocess
-        processed = preprocess_image(image)
+        processed = preprocess_image(image, profile)
         
         # OCR with Vietnamese language
-        text = pytesseract.image_to_string(
-            processed,
-            lang='vie+eng',
-            config='--psm 6'
-        )
+        text = get_engine().recognize(processed, psm=6)
         
         return text.strip()
         
     except Exception as e:
-        raise Exception(f"OCR processing failed: {e}")
\ No newline at end of file
+        raise Exception(f"OCR processing failed: {e}")
+
+def crop_region(image: Image.Image, region: Dict[str, Any]) -> Image.Image:
+    """Crop a region given as fractions of the page size"""
+    left = int(region["x"] * image.width)
+    top = int(region["y"] * image.height)
+    right = min(int((region["x"] + region["width"]) * image.width), image.width)
+    bottom = min(int((region["y"] + region["height"]) * image.height), image.height)
+    return image.crop((left, top, right, bottom))
+
+def process_ocr_regions(
+    image: Image.Image,
+    regions: List[Dict[str, Any]],
+    profile: Optional[str] = None
+) -> Dict[str, str]:
+    """OCR only the template regions and return their text by region name"""
+    engine = get_engine()
+    fields = {}
+
+    try:
+        for region in regions:
+            processed = preprocess_image(crop_region(image, region), profile)
+            text = engine.recognize(processed, psm=region.get("psm", 6), whitelist=region.get("whitelist"))
+            fields[region["name"]] = text.strip()
+    except Exception as e:
+        raise Exception(f"OCR processing failed: {e}")
+
+    return fields
+
+def format_fields(fields: Dict[str, str]) -> str:
+    """Render structured region text for the AI prompt"""
+    return "\n".join(f"[{name}]\n{text}" for name, text in fields.items())
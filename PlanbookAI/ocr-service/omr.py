@@ -0,0 +1,193 @@
+"""Bubble-sheet (OMR) reader for multiple-choice answer sheets.
+
+The standard sheet has a solid square fiducial in each corner and a grid of
+option bubbles. A scan is warped onto the canonical layout using the
+fiducials, then every bubble is sampled at once with NumPy indexing.
+"""
+from PIL import Image, ImageDraw, ImageFont
+from pydantic import BaseModel
+from typing import Dict, List, Any
+import cv2
+import numpy as np
+
+class SheetNotDetectedError(Exception):
+    pass
+
+class SheetLayout(BaseModel):
+    # Canonical page size in pixels (A4 at 150 DPI)
+    width: int = 1240
+    height: int = 1754
+    fiducial_size: int = 50
+    fiducial_margin: int = 40
+    # Answer grid
+    grid_left: int = 110
+    grid_top: int = 400
+    column_width: int = 255
+    row_height: int = 50
+    rows_per_column: int = 25
+    columns: int = 4
+    first_bubble_offset: int = 75
+    bubble_spacing: int = 45
+    bubble_radius: int = 14
+    options: List[str] = ["A", "B", "C", "D"]
+    # Fraction of dark pixels inside a bubble for it to count as filled
+    fill_threshold: float = 0.45
+
+    @property
+    def max_questions(self) -> int:
+        return self.rows_per_column * self.columns
+
+DEFAULT_LAYOUT = SheetLayout()
+
+def fiducial_centers(layout: SheetLayout) -> np.ndarray:
+    """Fiducial centers in canonical coordinates, ordered tl, tr, br, bl"""
+    offset = layout.fiducial_margin + layout.fiducial_size / 2
+    return np.array([
+        [offset, offset],
+        [layout.width - offset, offset],
+        [layout.width - offset, layout.height - offset],
+        [offset, layout.height - offset],
+    ], dtype=np.float32)
+
+def bubble_centers(layout: SheetLayout, num_questions: int) -> np.ndarray:
+    """(x, y) centers of every bubble, shaped (questions, options, 2)"""
+    index = np.arange(num_questions)
+    column = index // layout.rows_per_column
+    row = index % layout.rows_per_column
+    option = np.arange(len(layout.options))
+
+    xs = (layout.grid_left + column * layout.column_width + layout.first_bubble_offset)[:, None] \
+        + option[None, :] * layout.bubble_spacing
+    ys = (layout.grid_top + row * layout.row_height + layout.row_height / 2)[:, None] \
+        + np.zeros_like(option)[None, :]
+
+    return np.stack([xs, ys], axis=-1).astype(np.float32)
+
+def _disk_offsets(radius: float) -> np.ndarray:
+    r = int(np.ceil(radius))
+    ys, xs = np.mgrid[-r:r + 1, -r:r + 1]
+    inside = xs ** 2 + ys ** 2 <= radius ** 2
+    return np.stack([ys[inside], xs[inside]], axis=1)
+
+def _find_fiducials(binary: np.ndarray, layout: SheetLayout) -> np.ndarray:
+    height, width = binary.shape
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    expected_area = (layout.fiducial_size * width / layout.width) ** 2
+    candidates = []
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        if not 0.2 * expected_area <= area <= 5 * expected_area:
+            continue
+        x, y, w, h = cv2.boundingRect(contour)
+        # Fiducials are solid, roughly square blobs
+        if not 0.7 <= w / h <= 1.3 or area / (w * h) < 0.8:
+            continue
+        candidates.append((x + w / 2, y + h / 2))
+
+    if len(candidates) < 4:
+        raise SheetNotDetectedError("Fiducial markers not found")
+
+    points = np.array(candidates, dtype=np.float32)
+    corners = np.array([[0, 0], [width, 0], [width, height], [0, height]], dtype=np.float32)
+    distances = np.linalg.norm(points[None, :, :] - corners[:, None, :], axis=2)
+    nearest = distances.argmin(axis=1)
+
+    # Each corner needs its own marker, reasonably close to that corner
+    max_distance = 0.25 * np.hypot(width, height)
+    if len(set(nearest.tolist())) < 4 or (distances[np.arange(4), nearest] > max_distance).any():
+        raise SheetNotDetectedError("Fiducial markers not found")
+
+    return points[nearest]
+
+def read_bubble_sheet(
+    image: Image.Image,
+    num_questions: int,
+    layout: SheetLayout = DEFAULT_LAYOUT
+) -> Dict[str, Any]:
+    """Detect filled bubbles on a standard answer sheet"""
+    if num_questions > layout.max_questions:
+        raise ValueError(f"Layout supports at most {layout.max_questions} questions")
+
+    gray = np.asarray(image.convert("L"))
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, binary = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+
+    # Warp the scan onto the canonical layout
+    source = _find_fiducials(binary, layout)
+    transform = cv2.getPerspectiveTransform(source, fiducial_centers(layout))
+    warped = cv2.warpPerspective(binary, transform, (layout.width, layout.height))
+
+    # Sample the inner part of every bubble so the printed outline is ignored
+    centers = np.rint(bubble_centers(layout, num_questions)).astype(np.intp)
+    offsets = _disk_offsets(layout.bubble_radius * 0.7)
+    ys = centers[..., 1, None] + offsets[:, 0]
+    xs = centers[..., 0, None] + offsets[:, 1]
+    fill = warped[ys, xs].mean(axis=-1) / 255.0
+
+    marked = fill >= layout.fill_threshold
+    marked_count = marked.sum(axis=1)
+    best = fill.argmax(axis=1)
+
+    answers = {}
+    blank = []
+    multiple = []
+    for index in range(num_questions):
+        number = str(index + 1)
+        if marked_count[index] == 1:
+            answers[number] = layout.options[best[index]]
+        elif marked_count[index] == 0:
+            answers[number] = None
+            blank.append(index + 1)
+        else:
+            answers[number] = None
+            multiple.append(index + 1)
+
+    return {
+        "answers": answers,
+        "blank_questions": blank,
+        "multiple_marked_questions": multiple,
+        "fill_ratios": np.round(fill, 3).tolist()
+    }
+
+def _load_font(size: int):
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
+
+def render_answer_sheet(
+    num_questions: int,
+    title: str = "",
+    layout: SheetLayout = DEFAULT_LAYOUT
+) -> Image.Image:
+    """Render a printable blank answer sheet for the given layout"""
+    if num_questions > layout.max_questions:
+        raise ValueError(f"Layout supports at most {layout.max_questions} questions")
+
+    sheet = Image.new("L", (layout.width, layout.height), 255)
+    draw = ImageDraw.Draw(sheet)
+    font = _load_font(20)
+
+    half = layout.fiducial_size / 2
+    for x, y in fiducial_centers(layout):
+        draw.rectangle([x - half, y - half, x + half, y + half], fill=0)
+
+    header_left = layout.grid_left
+    draw.text((header_left, 150), title, fill=0, font=font)
+    draw.text((header_left, 220), "Họ và tên:", fill=0, font=font)
+    draw.line([header_left + 160, 235, layout.width - 150, 235], fill=0)
+    draw.text((header_left, 290), "Mã học sinh:", fill=0, font=font)
+    draw.line([header_left + 160, 305, layout.width - 150, 305], fill=0)
+
+    option_font = _load_font(14)
+    radius = layout.bubble_radius
+    centers = bubble_centers(layout, num_questions)
+    for index in range(num_questions):
+        row_x, row_y = centers[index, 0]
+        draw.text((row_x - layout.first_bubble_offset + 10, row_y), f"{index + 1}.", fill=0, font=font, anchor="lm")
+        for option, (x, y) in zip(layout.options, centers[index]):
+            draw.ellipse([x - radius, y - radius, x + radius, y + radius], outline=0, width=2)
+            draw.text((x, y), option, fill=190, font=option_font, anchor="mm")
+
+    return sheet
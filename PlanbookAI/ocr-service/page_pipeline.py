@@ -0,0 +1,186 @@
+"""CPU-bound page work, run in a process pool owned by each worker.
+
+Tesseract (OpenMP) and OpenCV each start their own thread pools, so several
+sheets graded at once oversubscribe the host. Page work therefore runs in a
+pool of ``OCR_POOL_PROCESSES`` processes, each limited to
+``OCR_THREADS_PER_PROCESS`` threads and holding its own OCR engine. Jobs and
+results cross the process boundary as small dicts: every process loads the
+image itself from the blob store. Templates with more than
+``OCR_REGIONS_PER_TASK`` regions are split into chunks that run on several
+processes at once.
+"""
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Any, Optional
+import asyncio
+import base64
+import cv2
+import io
+import logging
+import multiprocessing
+import os
+import signal
+
+from config import settings
+from blob_store import open_blob
+from batch_ingest import render_pdf_page
+from omr import read_bubble_sheet, SheetNotDetectedError
+from ocr_processor import process_ocr_image, process_ocr_regions
+from ocr_engine import get_engine
+from failures import classify
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Template regions that identify the student
+HEADER_FIELDS = ("student_name", "student_id")
+
+def limit_threads(threads: int):
+    """Cap OpenMP (Tesseract) and OpenCV threads for this process"""
+    # Read by Tesseract's OpenMP runtime when it loads, and inherited by pytesseract's subprocess
+    os.environ["OMP_THREAD_LIMIT"] = str(threads)
+    cv2.setNumThreads(threads)
+
+def init_pool_process(threads: int):
+    # The worker supervisor handles signals
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    limit_threads(threads)
+
+    # OCR and preprocessing timings are flushed from this process
+    metrics.start_flusher()
+
+    # Load the OCR models before the first page
+    get_engine()
+
+def job_image_ref(ocr_queue) -> Dict[str, Any]:
+    """What a pool process needs to load a job's image"""
+    return {
+        "source_type": ocr_queue.source_type,
+        "image_digest": ocr_queue.image_digest,
+        "page_number": ocr_queue.page_number,
+        "image_data": None if ocr_queue.image_digest else ocr_queue.image_data
+    }
+
+def load_job_image(job: Dict[str, Any]) -> Image.Image:
+    """Load the job's image from the blob store, or the legacy base64 column"""
+    if job["source_type"] == "pdf_page":
+        return render_pdf_page(job["image_digest"], job["page_number"])
+
+    if job["image_digest"]:
+        with open_blob(job["image_digest"]) as mapped:
+            image = Image.open(mapped)
+            # Decode while the mapping is still open
+            image.load()
+        return image
+
+    if not job["image_data"]:
+        # Permanent failure (see failures.is_transient)
+        raise FileNotFoundError("The job's image was removed by compaction; upload the sheet again")
+    image_bytes = base64.b64decode(job["image_data"])
+    return Image.open(io.BytesIO(image_bytes))
+
+def analyze_page(
+    job: Dict[str, Any],
+    num_questions: int,
+    regions: List[Dict[str, Any]],
+    profile: Optional[str],
+    split_regions: bool
+) -> Dict[str, Any]:
+    """Everything CPU-bound for one page: bubble reading and OCR.
+
+    If the page is not a bubble sheet and split_regions is set, the template
+    regions are left for the caller to fan out with ``ocr_region_chunk``.
+    Failures are raised as StageError ("preprocess" or "ocr").
+    """
+    page = {"omr": None, "fields": None, "text": None}
+
+    try:
+        image = load_job_image(job)
+
+        if settings.OCR_OMR_ENABLED and num_questions:
+            try:
+                page["omr"] = read_bubble_sheet(image, num_questions)
+            except (SheetNotDetectedError, ValueError) as e:
+                logger.info(f"Bubble sheet not detected, using AI fallback: {e}")
+    except Exception as e:
+        raise classify("preprocess", e)
+
+    try:
+        if page["omr"] is not None:
+            # Answers came from the bubbles; only the header needs OCR
+            header_regions = [r for r in regions if r["name"] in HEADER_FIELDS]
+            if header_regions:
+                page["fields"] = process_ocr_regions(image, header_regions, profile)
+        elif regions:
+            if not split_regions:
+                page["fields"] = process_ocr_regions(image, regions, profile)
+        else:
+            page["text"] = process_ocr_image(image, profile)
+    except Exception as e:
+        raise classify("ocr", e)
+
+    return page
+
+def ocr_region_chunk(job: Dict[str, Any], regions: List[Dict[str, Any]], profile: Optional[str]) -> Dict[str, str]:
+    try:
+        return process_ocr_regions(load_job_image(job), regions, profile)
+    except Exception as e:
+        raise classify("ocr", e)
+
+def pool_size() -> int:
+    """Pool processes per worker; by default the cores are split between workers"""
+    if settings.OCR_POOL_PROCESSES:
+        return settings.OCR_POOL_PROCESSES
+    return max(1, (os.cpu_count() or 1) // max(1, settings.OCR_WORKER_PROCESSES))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=pool_size(),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_pool_process,
+            initargs=(settings.OCR_THREADS_PER_PROCESS,)
+        )
+    return _pool
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+async def run_in_pool(fn, *args):
+    """Run a page function in the pool; a crashed pool is replaced for later jobs"""
+    global _pool
+    pool = get_pool()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+    except BrokenProcessPool:
+        logger.error("OCR process pool crashed, starting a new one")
+        if _pool is pool:
+            _pool = None
+            pool.shutdown(wait=False)
+        raise
+
+async def ocr_regions_parallel(
+    job: Dict[str, Any],
+    regions: List[Dict[str, Any]],
+    profile: Optional[str]
+) -> Dict[str, str]:
+    """OCR a large template in chunks spread over the pool"""
+    chunk_count = -(-len(regions) // settings.OCR_REGIONS_PER_TASK)
+    chunks = [regions[index::chunk_count] for index in range(chunk_count)]
+    results = await asyncio.gather(*(
+        run_in_pool(ocr_region_chunk, job, chunk, profile) for chunk in chunks
+    ))
+
+    fields = {}
+    for chunk_fields in results:
+        fields.update(chunk_fields)
+    # Keep the template's region order for the prompt
+    return {region["name"]: fields[region["name"]] for region in regions}
@@ -0,0 +1,192 @@
+"""Push channel for OCR job status changes.
+
+Each API process binds its own exclusive queue to the ``ocr_events`` fanout
+exchange (``utils.publish_event`` copies every event there) and hands the
+events to the Server-Sent Events streams open in that process, and to any
+listeners registered with ``add_listener``. Clients see pending -> processing
+-> completed/failed without polling the database.
+
+A stream starts with a snapshot read from the database; ``StreamState``
+drops the events that snapshot already reflects by job id and status, since
+event timestamps come from other hosts' clocks.
+"""
+from typing import Dict, Any, Callable, List, Optional, Set
+import asyncio
+import json
+import logging
+import threading
+import time
+
+import pika
+
+from config import settings
+from utils import EVENTS_EXCHANGE
+from metrics import increment
+
+logger = logging.getLogger(__name__)
+
+# Job status after each event
+EVENT_STATUS = {
+    "ocr.uploaded": "pending",
+    "ocr.batch_uploaded": "pending",
+    "ocr.requeued": "pending",
+    "ocr.replayed": "pending",
+    "ocr.processing": "processing",
+    "ocr.completed": "completed",
+    "ocr.failed": "failed",
+    "ocr.dead_lettered": "dead_letter",
+}
+
+TERMINAL_STATUSES = ("completed", "failed", "dead_letter")
+
+class StreamState:
+    """Job statuses a stream's client already has: the snapshot plus events sent since"""
+
+    def __init__(self, statuses: Dict[str, str], batch_id: Optional[str] = None):
+        self.statuses = statuses
+        self.batch_id = batch_id
+
+    def covers(self, message: Dict[str, Any]) -> bool:
+        """Whether message is already reflected (or superseded) by what was sent"""
+        event = message["event"]
+        if event == "ocr.batch_uploaded":
+            # The batch's snapshot was read after its pages were stored
+            return self.batch_id is not None and message.get("batch_id") == self.batch_id
+        known = self.statuses.get(message.get("ocr_id"))
+        if known is None:
+            return False
+        if message["status"] == known or event == "ocr.uploaded":
+            return True
+        # A finished job only moves again when replayed (see record)
+        return known in TERMINAL_STATUSES
+
+    def record(self, message: Dict[str, Any]):
+        if message["event"] == "ocr.replayed":
+            # Replays are announced per group, so any finished job may be pending again
+            self.statuses = {
+                ocr_id: status for ocr_id, status in self.statuses.items()
+                if status not in TERMINAL_STATUSES
+            }
+        elif message.get("ocr_id"):
+            self.statuses[message["ocr_id"]] = message["status"]
+
+class Subscription:
+    """One open stream: a bounded queue fed from the consumer thread"""
+
+    def __init__(self, user_id: str, see_all: bool, batch_id: Optional[str], ocr_id: Optional[str]):
+        self.user_id = user_id
+        self.see_all = see_all
+        self.batch_id = batch_id
+        self.ocr_id = ocr_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.OCR_STREAM_QUEUE_SIZE)
+
+    def matches(self, data: Dict[str, Any]) -> bool:
+        if not self.see_all and data.get("user_id") != self.user_id:
+            return False
+        if self.batch_id and data.get("batch_id") != self.batch_id:
+            return False
+        if self.ocr_id and data.get("ocr_id") != self.ocr_id:
+            return False
+        return True
+
+    def offer(self, message: Dict[str, Any]):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Slow client; it can catch up from GET /ocr/batch or /ocr/result
+            increment("ocr_stream_dropped_total")
+
+class ProgressHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions: Set[Subscription] = set()
+
+    def subscribe(
+        self,
+        user_id: str,
+        see_all: bool = False,
+        batch_id: Optional[str] = None,
+        ocr_id: Optional[str] = None
+    ) -> Subscription:
+        subscription = Subscription(user_id, see_all, batch_id, ocr_id)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def dispatch(self, event: Dict[str, Any]):
+        """Fan an event out to matching streams; called from the consumer thread"""
+        status = EVENT_STATUS.get(event.get("event_type"))
+        if status is None:
+            return
+
+        data = event.get("data") or {}
+        message = {
+            "event": event["event_type"],
+            "status": status,
+            "timestamp": event.get("timestamp"),
+            **data
+        }
+
+        with self._lock:
+            subscriptions = [s for s in self._subscriptions if s.matches(data)]
+        for subscription in subscriptions:
+            subscription.loop.call_soon_threadsafe(subscription.offer, message)
+
+hub = ProgressHub()
+
+# Other in-process consumers of the same events (e.g. analytics)
+_listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+def add_listener(listener: Callable[[Dict[str, Any]], None]):
+    """Also pass every event to listener; it runs on the consumer thread"""
+    _listeners.append(listener)
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def start_event_consumer():
+    """Feed the hub from the ocr_events exchange, reconnecting if RabbitMQ drops"""
+    while True:
+        try:
+            credentials = pika.PlainCredentials('admin', 'admin123')
+            parameters = pika.ConnectionParameters(
+                host='rabbitmq',
+                credentials=credentials
+            )
+            connection = pika.BlockingConnection(parameters)
+            channel = connection.channel()
+            channel.exchange_declare(exchange=EVENTS_EXCHANGE, exchange_type='fanout')
+
+            # Private queue per process: every API instance sees every event
+            queue_name = channel.queue_declare(queue='', exclusive=True).method.queue
+            channel.queue_bind(exchange=EVENTS_EXCHANGE, queue=queue_name)
+
+            def callback(ch, method, properties, body):
+                try:
+                    event = json.loads(body)
+                    hub.dispatch(event)
+                except Exception as e:
+                    logger.error(f"Error dispatching OCR event: {e}")
+                    return
+                for listener in _listeners:
+                    try:
+                        listener(event)
+                    except Exception as e:
+                        logger.error(f"OCR event listener failed: {e}")
+
+            channel.basic_consume(
+                queue=queue_name,
+                on_message_callback=callback,
+                auto_ack=True
+            )
+
+            logger.info("Started consuming ocr_events")
+            channel.start_consuming()
+        except Exception as e:
+            logger.error(f"OCR event consumer stopped: {e}")
+        time.sleep(5)
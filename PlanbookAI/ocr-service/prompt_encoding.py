@@ -0,0 +1,88 @@
+"""Compact encodings of exam questions for Gemini prompts.
+
+Prompts used to embed the exam as indented JSON with every option body.
+Reading a sheet only needs question numbers and letters, so keys are sent as
+``1:A 2:C ...`` and option text is added only for sheets where students write
+the option content instead of a letter (``answer_format="text"``).
+
+Token counts are estimated locally (about four UTF-8 bytes per token) so
+they can be recorded on every call without an extra API round-trip.
+"""
+from typing import Dict, List, Any, Iterable, Optional
+import json
+import logging
+
+from metrics import observe
+
+logger = logging.getLogger(__name__)
+
+ANSWER_FORMATS = ("letter", "text")
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text.encode("utf-8")) // 4) if text else 0
+
+def size_bucket(question_count: int) -> str:
+    """Coarse exam-size label, so metrics stay low-cardinality"""
+    for limit in (20, 50, 100):
+        if question_count <= limit:
+            return f"<={limit}"
+    return ">100"
+
+def _correct_letter(question: Dict[str, Any]) -> str:
+    return str(question.get("correct_answer") or "?").strip().upper()
+
+def encode_answer_key(
+    questions: List[Dict[str, Any]],
+    numbers: Optional[Iterable[int]] = None
+) -> str:
+    """Questions as ``1:A 2:C``; questions are numbered in order"""
+    numbers = range(1, len(questions) + 1) if numbers is None else numbers
+    return " ".join(
+        f"{number}:{_correct_letter(questions[number - 1])}"
+        for number in numbers
+    )
+
+def encode_options(questions: List[Dict[str, Any]]) -> str:
+    """One line per question with its option bodies, for text-answer sheets"""
+    lines = []
+    for number, question in enumerate(questions, start=1):
+        options = question.get("options") or {}
+        if isinstance(options, list):
+            options = {chr(ord("A") + index): option for index, option in enumerate(options)}
+        choices = " | ".join(f"{letter}) {text}" for letter, text in sorted(options.items()))
+        lines.append(f"{number}: {choices}")
+    return "\n".join(lines)
+
+def encode_incorrect(
+    questions: List[Dict[str, Any]],
+    answers: Dict[str, Any],
+    numbers: Iterable[int]
+) -> str:
+    """Wrong answers as ``3:C (HS: B) question text``, without option bodies"""
+    return "\n".join(
+        f"{encode_answer_key(questions, [number])} (HS: {answers.get(str(number)) or '-'}) "
+        f"{questions[number - 1].get('question_text') or ''}".rstrip()
+        for number in numbers
+    )
+
+def encode_verbose(questions: List[Dict[str, Any]]) -> str:
+    """The former prompt encoding, kept only as the token-count baseline"""
+    return json.dumps(questions, ensure_ascii=False, indent=2, default=str)
+
+def record_prompt_tokens(
+    kind: str,
+    prompt: str,
+    compact: str,
+    questions: List[Dict[str, Any]]
+) -> Dict[str, int]:
+    """Record estimated tokens of the question block before and after compaction"""
+    counts = {
+        "verbose": estimate_tokens(encode_verbose(questions)),
+        "compact": estimate_tokens(compact),
+        "total": estimate_tokens(prompt)
+    }
+    size = size_bucket(len(questions))
+    for encoding, tokens in counts.items():
+        observe("ai_prompt_tokens", tokens, prompt=kind, encoding=encoding, size=size)
+    logger.debug(f"{kind} prompt tokens for {len(questions)} questions: {counts}")
+    return counts
@@ -0,0 +1,157 @@
+"""Matching of OCR-extracted student names and IDs to a class roster.
+
+Names are folded before comparison: Vietnamese diacritics and ``đ`` are
+removed, case and punctuation dropped, so "Nguyễn Văn Đạt", "NGUYEN VAN DAT"
+and "Nguyen Van Dat" are the same string. Each roster gets an inverted index
+from name trigrams to students (built once per roster version and cached per
+process); a lookup adds up the posting lists of the query's trigrams with
+``np.bincount`` and scores every student by trigram similarity
+(shared / union, as in pg_trgm), so word order and a few misread letters
+barely matter.
+
+An exact student ID match wins unless the name clearly points to someone
+else. A name match is ``ambiguous`` when the runner-up scores within
+``ROSTER_AMBIGUITY_MARGIN`` of the best, and ``unmatched`` below
+``ROSTER_MIN_CONFIDENCE``.
+"""
+from sqlalchemy.orm import Session
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Set
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+from models import ClassRoster
+from config import settings
+
+def fold(text: Optional[str]) -> str:
+    """Lowercase ASCII words: diacritics, đ and punctuation removed"""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFD", text.replace("đ", "d").replace("Đ", "D"))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+def fold_student_id(student_id: Optional[str]) -> str:
+    return re.sub(r"[^a-z0-9]", "", fold(student_id))
+
+def trigrams(folded: str) -> Set[str]:
+    """Trigrams of each word padded as in pg_trgm ("  an " -> "  a", " an", "an ")"""
+    grams = set()
+    for word in folded.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class RosterIndex:
+    """Trigram index over the students of one roster version"""
+
+    def __init__(self, students: List[Dict[str, Any]]):
+        self.students = students
+        self.by_student_id = {}
+        postings: Dict[str, List[int]] = {}
+        sizes = []
+
+        for index, student in enumerate(students):
+            folded_id = fold_student_id(student.get("student_id"))
+            if folded_id:
+                self.by_student_id.setdefault(folded_id, index)
+            grams = trigrams(fold(student.get("full_name")))
+            sizes.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(index)
+
+        self.sizes = np.array(sizes, dtype=np.int32)
+        self.postings = {gram: np.array(indexes, dtype=np.int32) for gram, indexes in postings.items()}
+
+    def similarities(self, name: Optional[str]) -> np.ndarray:
+        """Trigram similarity of name to every student"""
+        grams = trigrams(fold(name))
+        lists = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not lists:
+            return np.zeros(len(self.students))
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.students))
+        return shared / (len(grams) + self.sizes - shared)
+
+    def _candidate(self, index: int, confidence: float) -> Dict[str, Any]:
+        student = self.students[index]
+        return {
+            "roster_student_id": student["id"],
+            "student_id": student.get("student_id"),
+            "full_name": student["full_name"],
+            "confidence": round(float(confidence), 3)
+        }
+
+    def match(self, name: Optional[str], student_id: Optional[str]) -> Dict[str, Any]:
+        """Resolve extracted values to a roster entry, with confidence and status"""
+        scores = self.similarities(name)
+        top = np.argsort(-scores, kind="stable")[:3]
+        candidates = [self._candidate(index, scores[index]) for index in top if scores[index] > 0]
+        id_index = self.by_student_id.get(fold_student_id(student_id))
+
+        if id_index is not None:
+            best = top[0] if len(top) else None
+            # The ID is trusted unless the name clearly belongs to another student
+            conflict = (
+                best is not None and best != id_index
+                and scores[best] >= settings.ROSTER_MIN_CONFIDENCE
+                and scores[best] - scores[id_index] > settings.ROSTER_AMBIGUITY_MARGIN
+            )
+            # Lowered towards 0.5 when the name read does not look like the roster's
+            confidence = 0.5 + 0.5 * scores[id_index] if fold(name) else 1.0
+            match = self._candidate(id_index, confidence)
+            return {
+                "status": "ambiguous" if conflict else "matched",
+                "method": "student_id",
+                **match,
+                "candidates": candidates
+            }
+
+        if not candidates or candidates[0]["confidence"] < settings.ROSTER_MIN_CONFIDENCE:
+            return {
+                "status": "unmatched",
+                "method": "name",
+                "confidence": candidates[0]["confidence"] if candidates else 0.0,
+                "candidates": candidates
+            }
+
+        runner_up = scores[top[1]] if len(top) > 1 else 0.0
+        ambiguous = scores[top[0]] - runner_up < settings.ROSTER_AMBIGUITY_MARGIN
+        return {
+            "status": "ambiguous" if ambiguous else "matched",
+            "method": "name",
+            **candidates[0],
+            "candidates": candidates
+        }
+
+_lock = threading.Lock()
+_indexes: "OrderedDict[tuple, RosterIndex]" = OrderedDict()
+
+def get_index(db: Session, roster_id) -> Optional[RosterIndex]:
+    """Cached index of a roster, rebuilt when the roster changes; None if it is gone"""
+    version = db.query(ClassRoster.updated_at).filter(ClassRoster.id == roster_id).first()
+    if version is None:
+        return None
+
+    key = (str(roster_id), version.updated_at)
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+
+    # Only a cache miss reads the student list itself
+    students = db.query(ClassRoster.students).filter(ClassRoster.id == roster_id).scalar()
+    index = RosterIndex(students or [])
+    with _lock:
+        _indexes[key] = index
+        while len(_indexes) > settings.ROSTER_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+def match_student(db: Session, roster_id, name: Optional[str], student_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Match against a stored roster; None if the roster no longer exists"""
+    index = get_index(db, roster_id)
+    return index.match(name, student_id) if index is not None else None
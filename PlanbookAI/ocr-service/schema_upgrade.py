@@ -0,0 +1,71 @@
+"""In-place upgrade of OCR tables created by earlier releases.
+
+``Base.metadata.create_all`` creates missing tables but never alters existing
+ones, so columns and indexes added to ``ocr_queue`` since the first release
+are added here. Every statement is idempotent; the API runs them at startup
+and they can be applied by hand with ``python schema_upgrade.py``.
+
+A change that adds a column or index to an existing table must append its
+statement below.
+"""
+import logging
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Serializes concurrent upgrades from several API processes
+UPGRADE_LOCK_ID = 74_210_001
+
+UPGRADE_STATEMENTS = (
+    # Leased claims, retries and checkpoints (worker queue)
+    "ALTER TABLE ocr_queue ADD COLUMN IF NOT EXISTS worker_id VARCHAR(100)",
+    "ALTER TABLE ocr_queue ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP",
+    "ALTER TABLE ocr_queue ADD COLUMN IF NOT EXISTS attempts INTEGER DEFAULT 0",
+    "ALTER TABLE ocr_queue ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP",
+    "ALTER TABLE ocr_queue ADD COLUMN IF NOT EXISTS failure_stage VARCHAR(20)",
+    "ALTER TABLE ocr_queue ADD COLUMN IF NOT EXISTS checkpoint JSONB",
+    # Content-addressed images
+    "ALTER TABLE ocr_queue ADD COLUMN IF NOT EXISTS image_digest VARCHAR(64)",
+    "ALTER TABLE ocr_queue ADD COLUMN IF NOT EXISTS image_size BIGINT",
+    # PDF/ZIP batches
+    "ALTER TABLE ocr_queue ADD COLUMN IF NOT EXISTS source_type VARCHAR(20)",
+    "ALTER TABLE ocr_queue ADD COLUMN IF NOT EXISTS batch_id UUID",
+    "ALTER TABLE ocr_queue ADD COLUMN IF NOT EXISTS page_number INTEGER",
+    # Per-upload grading options
+    "ALTER TABLE ocr_queue ADD COLUMN IF NOT EXISTS preprocess_profile VARCHAR(50)",
+    "ALTER TABLE ocr_queue ADD COLUMN IF NOT EXISTS with_feedback BOOLEAN",
+    "ALTER TABLE ocr_queue ADD COLUMN IF NOT EXISTS roster_id UUID",
+    "ALTER TABLE ocr_queue ADD COLUMN IF NOT EXISTS priority INTEGER DEFAULT 0",
+    # Re-scan detection
+    "ALTER TABLE ocr_queue ADD COLUMN IF NOT EXISTS duplicate_of UUID",
+
+    "CREATE INDEX IF NOT EXISTS ix_ocr_queue_image_digest ON ocr_queue (image_digest)",
+    "CREATE INDEX IF NOT EXISTS ix_ocr_queue_batch_id ON ocr_queue (batch_id)",
+    "CREATE INDEX IF NOT EXISTS ix_ocr_queue_processing_completed_at ON ocr_queue (processing_completed_at)",
+    "CREATE INDEX IF NOT EXISTS ix_ocr_queue_exam_digest ON ocr_queue (exam_id, image_digest)",
+    "CREATE INDEX IF NOT EXISTS ix_ocr_queue_active ON ocr_queue (status) "
+    "WHERE status IN ('pending', 'processing')",
+    "CREATE INDEX IF NOT EXISTS ix_ocr_queue_user_status_created ON ocr_queue (user_id, status, created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_ocr_queue_user_created ON ocr_queue (user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_ocr_queue_exam_student_id_key ON ocr_queue "
+    "(exam_id, (result ->> 'student_id_key')) WHERE status = 'completed'",
+    "CREATE INDEX IF NOT EXISTS ix_ocr_queue_exam_student_name_key ON ocr_queue "
+    "(exam_id, (result ->> 'student_name_key')) WHERE status = 'completed'",
+)
+
+def upgrade_schema(engine):
+    """Apply UPGRADE_STATEMENTS in one transaction; run after create_all"""
+    with engine.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": UPGRADE_LOCK_ID})
+        for statement in UPGRADE_STATEMENTS:
+            connection.execute(text(statement))
+    logger.info("OCR schema is up to date")
+
+if __name__ == "__main__":
+    from database import Base, engine
+    import models  # registers the tables
+
+    logging.basicConfig(level=logging.INFO)
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
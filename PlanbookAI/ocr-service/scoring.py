@@ -0,0 +1,49 @@
+from typing import Dict, List, Any, Optional
+import re
+
+def normalize_answers(answers: Dict[Any, Any]) -> Dict[str, Optional[str]]:
+    """Normalise extracted answers to {"1": "A", ...}; unreadable keys are dropped"""
+    normalized = {}
+    for key, value in (answers or {}).items():
+        number = re.search(r"\d+", str(key))
+        if not number:
+            continue
+        letter = re.match(r"\s*\(?([A-Ha-h])\b", str(value)) if value is not None else None
+        normalized[str(int(number.group()))] = letter.group(1).upper() if letter else None
+    return normalized
+
+def question_points(question: Dict[str, Any]) -> float:
+    """Points of a question; 1 only when none are set, so 0-point questions stay at 0"""
+    points = question.get('points')
+    return 1.0 if points is None else float(points)
+
+def score_answers(
+    answers: Dict[str, Optional[str]],
+    questions: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Score extracted answers against the exam key; questions are numbered in order"""
+    total_points = 0.0
+    score = 0.0
+    correct_count = 0
+    incorrect_questions = []
+
+    for number, question in enumerate(questions, start=1):
+        points = question_points(question)
+        total_points += points
+
+        given = (answers.get(str(number)) or '').strip().upper()
+        expected = str(question.get('correct_answer') or '').strip().upper()
+
+        if given and given == expected:
+            score += points
+            correct_count += 1
+        else:
+            incorrect_questions.append(number)
+
+    return {
+        "correct_count": correct_count,
+        "score": score,
+        "total_points": total_points,
+        "percentage": round(score / total_points * 100, 2) if total_points else 0.0,
+        "incorrect_questions": incorrect_questions
+    }
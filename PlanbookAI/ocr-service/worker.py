@@ -0,0 +1,197 @@
+"""Standalone OCR grading worker.
+
+Run with ``python worker.py``. Spawns ``OCR_WORKER_PROCESSES`` processes that
+each keep up to ``OCR_CLAIM_BATCH_SIZE`` leased ``ocr_queue`` rows (see
+job_queue.py) in flight, so the API process only inserts jobs. Each worker
+hands page OCR to its own process pool (see page_pipeline.py), which is what
+spreads the CPU work over the cores. Database, Redis and RabbitMQ calls run
+in threads (``asyncio.to_thread``) so a slow one does not stall the other
+jobs of the window. Leases are renewed every third of ``OCR_LEASE_SECONDS``
+while a job is graded, so slow AI calls do not let another worker reclaim it.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+from sqlalchemy.orm import undefer
+from typing import Optional
+
+import metrics
+from models import OCRQueue
+from database import SessionLocal, Base, engine
+from config import settings
+from grading import process_grading_task
+from page_pipeline import get_pool, shutdown_pool, limit_threads
+from job_queue import claim_jobs, extend_lease, renew_lease, dead_letter_exhausted_jobs
+from compaction import run_compaction
+from schema_upgrade import upgrade_schema
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def load_job(db, job_id, worker_id: str) -> Optional[OCRQueue]:
+    """The claimed job with everything grading reads, or None if its lease is gone"""
+    job = db.query(OCRQueue).options(undefer(OCRQueue.checkpoint)).filter(OCRQueue.id == job_id).first()
+    if job is None or not extend_lease(db, job, worker_id):
+        return None
+    # The commit expired the row; reload it here, not lazily on the event loop
+    db.refresh(job)
+    return job
+
+def heartbeat(job_id, worker_id: str) -> bool:
+    """Renew a job's lease in a session of its own; grading holds the job's session"""
+    db = SessionLocal()
+    try:
+        return renew_lease(db, job_id, worker_id)
+    finally:
+        db.close()
+
+async def keep_lease(grading: asyncio.Task, job_id, worker_id: str):
+    """Renew the lease while grading runs; cancel it if another worker took the job"""
+    while True:
+        await asyncio.sleep(settings.OCR_LEASE_SECONDS / 3)
+        try:
+            renewed = await asyncio.to_thread(heartbeat, job_id, worker_id)
+        except Exception as e:
+            # The lease still has two beats left; try again on the next one
+            logger.warning(f"Could not renew lease on {job_id}: {e}")
+            continue
+        if not renewed:
+            if not grading.done():
+                logger.warning(f"Lost lease on {job_id}, cancelling")
+                grading.cancel()
+            return
+
+async def run_job(job_id, worker_index: int, worker_id: str):
+    """Grade one claimed job in its own session"""
+    db = SessionLocal()
+    lease = None
+    try:
+        job = await asyncio.to_thread(load_job, db, job_id, worker_id)
+        if job is None:
+            logger.warning(f"Lost lease on {job_id}, skipping")
+            return
+        logger.info(f"Worker {worker_index} processing {job_id}")
+        grading = asyncio.create_task(process_grading_task(db, job, worker_id))
+        lease = asyncio.create_task(keep_lease(grading, job_id, worker_id))
+        try:
+            await grading
+        except asyncio.CancelledError:
+            # Cancelled by keep_lease: the job belongs to another worker now
+            if not (lease.done() and grading.cancelled()):
+                raise
+            await asyncio.to_thread(db.rollback)
+    except Exception as e:
+        logger.error(f"Worker {worker_index} failed on {job_id}: {e}")
+        await asyncio.to_thread(db.rollback)
+    finally:
+        if lease is not None:
+            lease.cancel()
+        await asyncio.to_thread(db.close)
+
+def claim_more(worker_index: int, worker_id: str, limit: int) -> list:
+    """Claim up to limit more jobs, returning their ids"""
+    db = SessionLocal()
+    try:
+        dead_letter_exhausted_jobs(db)
+        return [job.id for job in claim_jobs(db, worker_id, limit)]
+    except Exception as e:
+        logger.error(f"Worker {worker_index} error: {e}")
+        db.rollback()
+        return []
+    finally:
+        db.close()
+
+async def run_worker(worker_index: int, stop_event):
+    """Keep a window of jobs in flight and grade them until asked to stop"""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    # Each pool process loads its own OCR models when it starts
+    get_pool()
+    logger.info(f"OCR worker {worker_index} started ({worker_id})")
+
+    in_flight = set()
+    compaction = None
+    next_compaction = time.monotonic()
+    next_flush = time.monotonic() + metrics.FLUSH_INTERVAL_SECONDS
+    while not stop_event.is_set():
+        # One worker compacts finished jobs in the background
+        interval = settings.OCR_COMPACTION_INTERVAL_SECONDS
+        if worker_index == 0 and interval and time.monotonic() >= next_compaction \
+                and (compaction is None or compaction.done()):
+            compaction = asyncio.create_task(asyncio.to_thread(run_compaction))
+            next_compaction = time.monotonic() + interval
+
+        # Recording metrics never touches Redis; push them from here, off the loop
+        if time.monotonic() >= next_flush:
+            await asyncio.to_thread(metrics.flush)
+            next_flush = time.monotonic() + metrics.FLUSH_INTERVAL_SECONDS
+
+        # Refill as jobs finish so the pool never idles behind a slow AI call
+        free = settings.OCR_CLAIM_BATCH_SIZE - len(in_flight)
+        job_ids = await asyncio.to_thread(claim_more, worker_index, worker_id, free) if free > 0 else []
+        for job_id in job_ids:
+            in_flight.add(asyncio.create_task(run_job(job_id, worker_index, worker_id)))
+
+        if not in_flight:
+            await asyncio.sleep(settings.OCR_WORKER_POLL_INTERVAL)
+            continue
+
+        # Jobs in flight together can share batched AI calls
+        done, in_flight = await asyncio.wait(
+            in_flight,
+            timeout=settings.OCR_WORKER_POLL_INTERVAL,
+            return_when=asyncio.FIRST_COMPLETED
+        )
+
+    if compaction is not None:
+        in_flight.add(compaction)
+    if in_flight:
+        await asyncio.wait(in_flight)
+    await asyncio.to_thread(metrics.flush)
+    shutdown_pool()
+    logger.info(f"OCR worker {worker_index} stopped")
+
+def worker_main(worker_index: int, stop_event):
+    # The supervisor handles SIGINT/SIGTERM and signals through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(run_worker(worker_index, stop_event))
+
+def main():
+    process_count = settings.OCR_WORKER_PROCESSES or os.cpu_count() or 1
+
+    # Workers may start before the API on an upgraded deployment
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+
+    # Inherited by the workers; their pool processes apply their own limit
+    limit_threads(settings.OCR_THREADS_PER_PROCESS)
+
+    # Spawn rather than fork so every worker opens its own DB connections
+    ctx = multiprocessing.get_context("spawn")
+    stop_event = ctx.Event()
+
+    processes = [
+        ctx.Process(target=worker_main, args=(i, stop_event), name=f"ocr-worker-{i}")
+        for i in range(process_count)
+    ]
+    for process in processes:
+        process.start()
+
+    def shutdown(signum, frame):
+        logger.info("Stopping OCR workers")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    logger.info(f"Started {process_count} OCR worker processes")
+    for process in processes:
+        process.join()
+
+if __name__ == "__main__":
+    main()
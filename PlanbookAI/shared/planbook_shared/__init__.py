@@ -0,0 +1,5 @@
+"""Helpers shared by the PlanbookAI Python services.
+
+Installed into each service image (``pip install ./shared``); for local runs
+use ``pip install -e PlanbookAI/shared``.
+"""
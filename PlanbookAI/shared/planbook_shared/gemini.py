@@ -0,0 +1,65 @@
+"""Gemini calls with the same limits in every service.
+
+``GeminiCaller.generate`` never blocks the event loop, caps the calls in
+flight per process (``AI_MAX_IN_FLIGHT``), gives each call a deadline
+(``AI_TIMEOUT_SECONDS``) and retries rate limits, overload and timeouts with
+exponential backoff and full jitter (``AI_MAX_RETRIES``,
+``AI_BACKOFF_BASE_SECONDS``, ``AI_BACKOFF_MAX_SECONDS``). Queue wait, model
+time and outcomes are reported to the service's metrics.
+"""
+from google.api_core import exceptions as google_exceptions
+import asyncio
+import logging
+import random
+import time
+
+from planbook_shared.metrics import Metrics, Timer
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying: rate limits, overload and timeouts
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    asyncio.TimeoutError,
+)
+
+class GeminiCaller:
+    """Calls one model; settings is the service's config with the AI_* fields"""
+
+    def __init__(self, model, settings, metrics: Metrics):
+        self.model = model
+        self.settings = settings
+        self.metrics = metrics
+        # Limits concurrent model calls from this process
+        self._semaphore = asyncio.Semaphore(settings.AI_MAX_IN_FLIGHT)
+
+    async def generate(self, prompt: str) -> str:
+        """Text of the model's response to prompt"""
+        settings = self.settings
+        for attempt in range(settings.AI_MAX_RETRIES + 1):
+            queued_at = time.perf_counter()
+            try:
+                async with self._semaphore:
+                    self.metrics.observe("ai_queue_wait_seconds", time.perf_counter() - queued_at)
+                    with Timer(self.metrics, "ai_model_seconds"):
+                        response = await asyncio.wait_for(
+                            self.model.generate_content_async(prompt),
+                            timeout=settings.AI_TIMEOUT_SECONDS
+                        )
+                self.metrics.increment("ai_requests_total", status="ok")
+                return response.text
+
+            except RETRYABLE_ERRORS as e:
+                self.metrics.increment("ai_requests_total", status=type(e).__name__)
+                if attempt == settings.AI_MAX_RETRIES:
+                    raise
+                # Exponential backoff with full jitter, outside the semaphore
+                delay = random.uniform(0, min(
+                    settings.AI_BACKOFF_MAX_SECONDS,
+                    settings.AI_BACKOFF_BASE_SECONDS * 2 ** attempt
+                ))
+                logger.warning(f"AI call failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
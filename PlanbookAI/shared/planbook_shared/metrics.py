@@ -0,0 +1,113 @@
+"""Lightweight metrics shared across the API and worker processes of a service.
+
+Observations are aggregated in memory and flushed into a Redis hash, so every
+process of a service contributes to the same series. Recording never touches
+Redis: each process flushes on its own schedule, either from a thread started
+with ``start_flusher`` or by calling ``flush`` off its event loop.
+``render()`` returns the Prometheus text format for a ``/metrics`` endpoint.
+"""
+from collections import defaultdict
+from typing import Callable, Dict
+import logging
+import threading
+import time
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_SECONDS = 5
+
+def _series(name: str, labels: Dict[str, str]) -> str:
+    if not labels:
+        return name
+    label_text = ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+    return f"{name}{{{label_text}}}"
+
+class Metrics:
+    """Counters and summaries under ``<namespace>:metrics``, gauges under ``<namespace>:metrics:gauges``"""
+
+    def __init__(self, namespace: str, get_redis: Callable[[], redis.Redis]):
+        self.metrics_key = f"{namespace}:metrics"
+        self.gauges_key = f"{namespace}:metrics:gauges"
+        self._get_redis = get_redis
+        self._lock = threading.Lock()
+        self._pending: Dict[str, float] = defaultdict(float)
+
+    def increment(self, name: str, amount: float = 1.0, **labels):
+        with self._lock:
+            self._pending[_series(name, labels)] += amount
+
+    def observe(self, name: str, value: float, **labels):
+        """Record a sample of a summary metric (exported as _sum and _count)"""
+        with self._lock:
+            self._pending[_series(f"{name}_sum", labels)] += value
+            self._pending[_series(f"{name}_count", labels)] += 1
+
+    def set_gauge(self, name: str, value: float, **labels):
+        try:
+            self._get_redis().hset(self.gauges_key, _series(name, labels), value)
+        except Exception as e:
+            logger.warning(f"Failed to set gauge {name}: {e}")
+
+    def flush(self):
+        """Push locally aggregated counters to Redis"""
+        with self._lock:
+            pending = dict(self._pending)
+            self._pending.clear()
+
+        if not pending:
+            return
+
+        try:
+            pipeline = self._get_redis().pipeline(transaction=False)
+            for series, value in pending.items():
+                pipeline.hincrbyfloat(self.metrics_key, series, value)
+            pipeline.execute()
+        except Exception as e:
+            logger.warning(f"Failed to flush metrics: {e}")
+
+    def start_flusher(self, interval: float = FLUSH_INTERVAL_SECONDS) -> threading.Thread:
+        """Flush every interval seconds from a daemon thread"""
+        def run():
+            while True:
+                time.sleep(interval)
+                self.flush()
+
+        thread = threading.Thread(target=run, name=f"{self.metrics_key}-flush", daemon=True)
+        thread.start()
+        return thread
+
+    def render(self) -> str:
+        """All series in Prometheus text exposition format"""
+        self.flush()
+        try:
+            client = self._get_redis()
+            values = {**client.hgetall(self.metrics_key), **client.hgetall(self.gauges_key)}
+        except Exception as e:
+            logger.warning(f"Failed to read metrics: {e}")
+            values = {}
+
+        lines = [
+            f"{series.decode()} {float(value)}"
+            for series, value in sorted(values.items())
+        ]
+        return "\n".join(lines) + "\n"
+
+class Timer:
+    """Context manager that observes the elapsed seconds of its block"""
+
+    def __init__(self, metrics: Metrics, name: str, **labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self._start
+        self.metrics.observe(self.name, self.elapsed, **self.labels)
+        return False